@@ -1,46 +1,197 @@
 from fastapi import Depends, HTTPException, Header
 from jose import jwt, jwk
 from jose.exceptions import JOSEError
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import asyncio
+import hashlib
 import httpx
+import logging
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
-ALIEN_SSO_URL = "https://sso.alien-api.com/oauth/jwks"
+ALIEN_SSO_URL = os.getenv("ALIEN_JWKS_URL", "https://sso.alien-api.com/oauth/jwks")
 AUDIENCE = os.getenv("ALIEN_PROVIDER_ADDRESS")
 ISSUER = "https://sso.alien-api.com"
 DEV_MODE = os.getenv("DEV_MODE", "true").lower() == "true"
 
-async def get_jwks():
-    async with httpx.AsyncClient() as client:
-        response = await client.get(ALIEN_SSO_URL)
-        response.raise_for_status()
-        return response.json()
+JWKS_TTL = 3600  # Keys older than this are refetched before use
+JWKS_REFRESH_INTERVAL = 600  # Background refresh period
+JWKS_REFETCH_INTERVAL = 30  # Minimum gap between refetches triggered by requests (stale keys, unknown kid)
+JWKS_FETCH_TIMEOUT = 5.0
+TOKEN_CACHE_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSCache:
+    """Signing keys by ``kid``, fetched over one pooled HTTP client.
+
+    Keys are refreshed in the background. A request finding them stale, or
+    presenting an unknown ``kid`` (key rotation), triggers a refetch at most once
+    per ``refetch_interval``, so neither junk tokens nor an SSO outage put a
+    fetch on every request. If a refetch fails the previous keys keep being
+    served. Only a cache that never got any keys fetches unthrottled.
+    """
+
+    def __init__(self, url: str = ALIEN_SSO_URL, ttl: float = JWKS_TTL,
+                 refresh_interval: float = JWKS_REFRESH_INTERVAL,
+                 refetch_interval: float = JWKS_REFETCH_INTERVAL,
+                 client: Optional[httpx.AsyncClient] = None):
+        self.url = url
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.refetch_interval = refetch_interval
+        self._client = client
+        self._keys: Dict[str, dict] = {}
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._last_completed = 0.0
+        self._lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=JWKS_FETCH_TIMEOUT)
+        return self._client
+
+    async def refresh(self) -> None:
+        """Fetch the key set. Concurrent callers share a single fetch."""
+        requested_at = time.monotonic()
+        async with self._lock:
+            if self._last_completed >= requested_at:
+                return  # Someone refreshed while we waited
+            self._last_attempt = time.monotonic()
+            try:
+                response = await self._http().get(self.url)
+            finally:
+                self._last_completed = time.monotonic()
+            response.raise_for_status()
+            self._keys = {
+                key["kid"]: {
+                    "kty": key["kty"],
+                    "kid": key["kid"],
+                    "use": key["use"],
+                    "n": key["n"],
+                    "e": key["e"]
+                }
+                for key in response.json()["keys"]
+            }
+            self._fetched_at = time.monotonic()
+
+    async def _refresh_quietly(self) -> None:
+        try:
+            await self.refresh()
+        except Exception:
+            if not self._keys:
+                raise
+            logger.warning("JWKS refresh failed; serving cached keys", exc_info=True)
+
+    async def get_key(self, kid: str) -> Optional[dict]:
+        now = time.monotonic()
+        if not self._keys:
+            await self._refresh_quietly()
+        elif (now - self._fetched_at > self.ttl or kid not in self._keys) \
+                and now - self._last_attempt >= self.refetch_interval:
+            await self._refresh_quietly()
+        return self._keys.get(kid)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.warning("Background JWKS refresh failed", exc_info=True)
+
+    def start(self) -> None:
+        """Start background refreshes."""
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+jwks_cache = JWKSCache()
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of already-verified tokens, so repeat requests skip RS256.
+
+    Entries are keyed by the token's SHA-256 and expire at the token's ``exp``.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[str]:
+        """Return the cached alien_id for a token, or None."""
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        alien_id, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return alien_id
+
+    def put(self, token: str, alien_id: str, expires_at: float) -> None:
+        if self.max_size <= 0:
+            return
+        key = self._key(token)
+        self._entries[key] = (alien_id, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+token_cache = VerifiedTokenCache()
+
 
 async def verify_alien_token(authorization: str = Header(...)):
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid auth header")
 
-    token = authorization.split(" ")[1]
+    return await authenticate_token(authorization.split(" ")[1])
+
 
+async def authenticate_token(token: str):
+    """Verify a raw token (header or query string) and return the alien_id."""
     # Dev mode: accept any token, extract alien_id from body later
     if DEV_MODE:
         return token  # Return the token itself as the identity
 
+    alien_id = token_cache.get(token)
+    if alien_id is not None:
+        return alien_id
+
     try:
-        jwks = await get_jwks()
         unverified_header = jwt.get_unverified_header(token)
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
+        rsa_key = await jwks_cache.get_key(unverified_header["kid"])
         if rsa_key:
             payload = jwt.decode(
                 token,
@@ -49,10 +200,14 @@ async def verify_alien_token(authorization: str = Header(...)):
                 audience=AUDIENCE,
                 issuer=ISSUER
             )
+            if payload.get("exp") is not None and payload.get("sub") is not None:
+                token_cache.put(token, payload["sub"], float(payload["exp"]))
             return payload.get("sub")  # alien_id
 
         raise HTTPException(status_code=401, detail="Unable to find appropriate key")
 
+    except HTTPException:
+        raise
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.JWTClaimsError:
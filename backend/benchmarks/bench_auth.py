@@ -0,0 +1,71 @@
+"""Microbenchmark token verification throughput with and without the verified-token cache.
+
+Signs tokens with a throwaway RSA key and serves its JWKS from an in-process
+stub, so no network or SSO account is needed. Runs on one core:
+
+    python -m benchmarks.bench_auth
+"""
+import argparse
+import asyncio
+import base64
+import os
+import time
+
+os.environ["DEV_MODE"] = "false"
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+import auth
+
+
+def _b64(value: int) -> str:
+    return base64.urlsafe_b64encode(value.to_bytes((value.bit_length() + 7) // 8, "big")).rstrip(b"=").decode()
+
+
+def make_signer():
+    """Return (jwks, sign(sub) -> token) for a fresh RSA key."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    numbers = key.public_key().public_numbers()
+    jwks = {"keys": [{"kty": "RSA", "kid": "bench", "use": "sig", "n": _b64(numbers.n), "e": _b64(numbers.e)}]}
+
+    def sign(sub: str) -> str:
+        claims = {"sub": sub, "aud": auth.AUDIENCE, "iss": auth.ISSUER, "exp": int(time.time()) + 3600}
+        return jwt.encode(claims, pem, algorithm="RS256", headers={"kid": "bench"})
+
+    return jwks, sign
+
+
+async def measure(name: str, tokens: list, requests: int) -> None:
+    start = time.perf_counter()
+    for i in range(requests):
+        await auth.authenticate_token(tokens[i % len(tokens)])
+    elapsed = time.perf_counter() - start
+    cache = auth.token_cache
+    print(f"{name:<10} {requests / elapsed:10.0f} req/s/core  (hits={cache.hits} misses={cache.misses})")
+
+
+async def main(requests: int, clients: int) -> None:
+    jwks, sign = make_signer()
+    stub = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=jwks)))
+    auth.jwks_cache = auth.JWKSCache(client=stub)
+    # Each simulated polling client presents the same token on every request
+    tokens = [sign(f"alien_{i}") for i in range(clients)]
+
+    auth.token_cache = auth.VerifiedTokenCache(max_size=0)
+    await measure("uncached", tokens, requests)
+    auth.token_cache = auth.VerifiedTokenCache()
+    await measure("cached", tokens, requests)
+    await auth.jwks_cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.clients))
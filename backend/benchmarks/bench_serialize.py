@@ -0,0 +1,73 @@
+"""Microbenchmark the serialization cost of one status response.
+
+Compares the previous path (FastAPI's jsonable_encoder plus the stdlib encoder
+in JSONResponse) with orjson and with the per-version status cache, which
+serializes once per version and then only splices in time_elapsed. Needs no
+Redis; the status is a synthetic active 10-player lobby:
+
+    python -m benchmarks.bench_serialize
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from lobby import MAX_NUMBER, _generate_random_grid
+from status_cache import StatusEntry
+
+PLAYERS = 10
+CALLED = 12
+
+
+def sample_status() -> dict:
+    started = datetime.utcnow() - timedelta(seconds=40)
+    players = {}
+    for i in range(PLAYERS):
+        grid = _generate_random_grid()
+        aid = f"bench_player_{i}"
+        players[aid] = {
+            "alien_id": aid,
+            "numbers": [n for row in grid for n in row],
+            "grid": grid,
+            "ready": True,
+            "active": True,
+            "joined_at": started.isoformat(),
+        }
+    called = random.sample(range(1, MAX_NUMBER + 1), CALLED)
+    return {
+        "lobby_id": "lobby_bench", "version": 42, "status": "active", "buy_in_amount": 3500,
+        "pot": 3500 * PLAYERS, "player_count": PLAYERS, "ready_count": PLAYERS, "players": players,
+        "forming_deadline": None, "latest_number": called[-1], "previous_number": called[-2],
+        "winner": None, "winning_pattern": None, "daub_mode": "manual",
+        "started_at": started.isoformat(), "time_elapsed": 40, "called_numbers": called,
+    }
+
+
+def measure(name: str, fn, iterations: int) -> None:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{name:<28} {per_call_us:8.2f} us/request  {len(fn())} bytes")
+
+
+def main(iterations: int) -> None:
+    status = sample_status()
+    entry = StatusEntry(dict(status))
+    response = JSONResponse(None)
+
+    measure("jsonable_encoder + json", lambda: response.render(jsonable_encoder(status)), iterations)
+    measure("orjson", lambda: orjson.dumps(status), iterations)
+    measure("cached full view", lambda: entry.render(entry.body), iterations)
+    measure("cached player view", lambda: entry.render(entry.player_view("bench_player_3")), iterations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    main(parser.parse_args().iterations)
@@ -0,0 +1,110 @@
+"""Benchmark get_game_status round trips and latency for a 10-player lobby.
+
+Compares the previous per-player read path against the single-script snapshot.
+Run from the backend directory against a local Redis:
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.bench_status
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from redis.asyncio.connection import Connection
+
+import codec
+import lobby
+from redis_client import lobby_key, redis
+
+PLAYERS = 10
+CALLED = 12
+
+round_trips = 0
+_send_packed_command = Connection.send_packed_command
+
+
+async def _counting_send_packed_command(self, *args, **kwargs):
+    global round_trips
+    round_trips += 1
+    return await _send_packed_command(self, *args, **kwargs)
+
+
+Connection.send_packed_command = _counting_send_packed_command
+
+
+async def legacy_get_game_status(lobby_id: str) -> dict:
+    """The sequential read path get_game_status used before the snapshot script."""
+    lobby_data = await redis.hgetall(lobby_key(lobby_id))
+    alien_ids = await redis.smembers(lobby_key(lobby_id, "players"))
+    players = {}
+    for aid in alien_ids:
+        player_data = await redis.hgetall(lobby_key(lobby_id, "player", aid))
+        grid = codec.decode_grid(player_data.get("grid", "[]"))
+        players[aid] = {
+            "alien_id": aid,
+            "numbers": [n for row in grid for n in row],
+            "grid": grid,
+        }
+    called_raw = await redis.get(lobby_key(lobby_id, "numbers_called"))
+    return {"lobby": lobby_data, "players": players, "called_numbers": codec.decode_numbers(called_raw)}
+
+
+async def seed_lobby() -> str:
+    """Create a lobby with PLAYERS players that have submitted grids and CALLED numbers drawn."""
+    created = await lobby.create_lobby()
+    lobby_id = created["lobby_id"]
+    # A preset deadline keeps the first join from scheduling the forming timer;
+    # keep other players out of the lobby while it is measured
+    await redis.hset(lobby_key(lobby_id), "forming_deadline", "seeded")
+    await redis.srem(lobby.EMPTY_LOBBIES_KEY, lobby_id)
+    grid = [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    for i in range(PLAYERS):
+        await lobby.add_player_to_lobby(lobby_id, f"bench_player_{i}")
+        await redis.hset(lobby_key(lobby_id, "player", f"bench_player_{i}"), mapping={
+            "grid": codec.encode_grid(grid),
+            "ready": "true",
+        })
+    await redis.set(lobby_key(lobby_id, "numbers_called"), codec.encode_numbers(range(1, CALLED + 1)))
+    return lobby_id
+
+
+async def cleanup(lobby_id: str) -> None:
+    """Remove every key and index entry seed_lobby() created."""
+    player_keys = [lobby_key(lobby_id, "player", f"bench_player_{i}") for i in range(PLAYERS)]
+    await redis.delete(lobby_key(lobby_id), lobby_key(lobby_id, "players"), lobby_key(lobby_id, "numbers_called"),
+                       lobby_key(lobby_id, "ledger"), *player_keys)
+    await redis.srem(lobby.ACTIVE_LOBBIES_KEY, lobby_id)
+    await redis.srem(lobby.EMPTY_LOBBIES_KEY, lobby_id)
+    await lobby.release_lobby_names([lobby_id])
+
+
+async def measure(name: str, fn, lobby_id: str, iterations: int) -> None:
+    global round_trips
+    await fn(lobby_id)  # warm up connections and the script cache
+    samples = []
+    round_trips = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn(lobby_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(
+        f"{name:<10} round_trips/call={round_trips / iterations:5.1f}  "
+        f"p50={statistics.median(samples):.3f}ms  p99={p99:.3f}ms"
+    )
+
+
+async def main(iterations: int) -> None:
+    lobby_id = await seed_lobby()
+    try:
+        await measure("before", legacy_get_game_status, lobby_id, iterations)
+        await measure("after", lobby.get_game_status, lobby_id, iterations)
+    finally:
+        await cleanup(lobby_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    asyncio.run(main(parser.parse_args().iterations))
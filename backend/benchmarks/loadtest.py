@@ -0,0 +1,218 @@
+"""Load generator for the full lobby lifecycle.
+
+Simulated players list lobbies, join one, submit a grid, poll status (with
+If-None-Match) and claim as soon as their grid has a line. The report covers
+overall throughput, p50/p95/p99 latency per endpoint and, when the app runs in
+process, Redis commands and round trips per request.
+
+In process (default) the app runs inside this process under DEV_MODE auth,
+against REDIS_URL or, with --fakeredis, an in-memory fakeredis server:
+
+    python -m benchmarks.loadtest --players 200 --duration 60
+    python -m benchmarks.loadtest --fakeredis --players 50 --call-interval 0.2
+
+Against a running server (no Redis counters):
+
+    python -m benchmarks.loadtest --url http://localhost:8000 --players 200
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+os.environ.setdefault("DEV_MODE", "true")
+
+import httpx
+
+_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("endpoint", default="background")
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.redis_commands: Dict[str, int] = defaultdict(int)
+        self.redis_round_trips: Dict[str, int] = defaultdict(int)
+        self.games_finished = 0
+        self.wins = 0
+
+    def report(self, elapsed: float, count_redis: bool) -> None:
+        total = sum(len(v) for v in self.latencies.values())
+        print(f"\n{total} requests in {elapsed:.1f}s = {total / elapsed:.0f} req/s; "
+              f"{self.games_finished} player-games finished, {self.wins} wins")
+        header = f"{'endpoint':<34}{'count':>8}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        if count_redis:
+            header += f"{'cmds/req':>10}{'rtt/req':>9}"
+        print(header)
+        for name in sorted(self.latencies):
+            samples = sorted(self.latencies[name])
+            line = (f"{name:<34}{len(samples):>8}{self.errors[name]:>8}"
+                    f"{statistics.median(samples):>9.2f}{_percentile(samples, 95):>9.2f}"
+                    f"{_percentile(samples, 99):>9.2f}")
+            if count_redis:
+                line += (f"{self.redis_commands[name] / len(samples):>10.1f}"
+                         f"{self.redis_round_trips[name] / len(samples):>9.1f}")
+            print(line)
+        if count_redis:
+            print(f"{'background (scheduler, reaper)':<34} redis commands={self.redis_commands['background']} "
+                  f"round trips={self.redis_round_trips['background']}")
+
+
+def _percentile(samples: List[float], pct: int) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def install_redis_counters(stats: Stats) -> None:
+    """Attribute every Redis command and round trip to the endpoint being served."""
+    from redis.asyncio.connection import Connection
+
+    pack_command = Connection.pack_command
+    pack_commands = Connection.pack_commands
+    send_packed_command = Connection.send_packed_command
+
+    def counting_pack_command(self, *args):
+        stats.redis_commands[_endpoint.get()] += 1
+        return pack_command(self, *args)
+
+    def counting_pack_commands(self, commands):
+        stats.redis_commands[_endpoint.get()] += len(commands)
+        return pack_commands(self, commands)
+
+    async def counting_send_packed_command(self, *args, **kwargs):
+        stats.redis_round_trips[_endpoint.get()] += 1
+        return await send_packed_command(self, *args, **kwargs)
+
+    Connection.pack_command = counting_pack_command
+    Connection.pack_commands = counting_pack_commands
+    Connection.send_packed_command = counting_send_packed_command
+
+
+class Player:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, alien_id: str, args):
+        self.client = client
+        self.stats = stats
+        self.alien_id = alien_id
+        self.args = args
+        self.headers = {"Authorization": f"Bearer {alien_id}"}
+
+    async def request(self, name: str, method: str, path: str, **kwargs) -> httpx.Response:
+        token = _endpoint.set(name)
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers={**self.headers, **kwargs.pop("headers", {})},
+                                                 **kwargs)
+        finally:
+            _endpoint.reset(token)
+        self.stats.latencies[name].append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            self.stats.errors[name] += 1
+        return response
+
+    async def join(self) -> str:
+        while True:
+            response = await self.request("GET /api/lobbies", "GET", "/api/lobbies")
+            if response.status_code == 429:
+                await asyncio.sleep(float(response.headers["retry-after"]))
+                continue
+            lobbies = response.json()["lobbies"]
+            open_lobbies = [lob for lob in lobbies
+                            if lob["status"] == "forming" and lob["player_count"] < lob["max_players"]]
+            if open_lobbies:
+                # Fill the fullest lobby first so games actually start
+                target = max(open_lobbies, key=lambda lob: lob["player_count"])
+                response = await self.request("POST /api/game/join", "POST", "/api/game/join",
+                                              json={"alien_id": self.alien_id, "lobby_id": target["lobby_id"]})
+                if response.status_code == 200:
+                    return target["lobby_id"]
+            await asyncio.sleep(random.uniform(0.05, 0.2))
+
+    async def play_game(self) -> None:
+        from lobby import check_win_patterns, _generate_random_grid
+
+        lobby_id = await self.join()
+        await asyncio.sleep(random.uniform(0, self.args.submit_delay))
+        grid = _generate_random_grid()
+        await self.request("POST /api/game/{id}/submit-grid", "POST", f"/api/game/{lobby_id}/submit-grid",
+                           json={"alien_id": self.alien_id, "grid": grid})
+
+        etag: Optional[str] = None
+        status: Optional[dict] = None
+        while True:
+            headers = {"If-None-Match": etag} if etag else {}
+            response = await self.request("GET /api/game/{id}/status", "GET", f"/api/game/{lobby_id}/status",
+                                          headers=headers)
+            if response.status_code == 200:
+                status = response.json()
+                etag = response.headers.get("etag")
+            elif response.status_code != 304:
+                break
+            if status["status"] == "finished" or not status["players"].get(self.alien_id, {}).get("active", True):
+                break
+            if status["status"] == "active":
+                called = set(status["called_numbers"])
+                if check_win_patterns(grid, called):
+                    highlighted = [n for row in grid for n in row if n in called]
+                    response = await self.request("POST /api/game/{id}/claim", "POST", f"/api/game/{lobby_id}/claim",
+                                                  json={"alien_id": self.alien_id, "highlighted_numbers": highlighted})
+                    if response.status_code == 200:
+                        self.stats.wins += 1
+                    break
+            await asyncio.sleep(self.args.poll_interval)
+        self.stats.games_finished += 1
+
+    async def run(self, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            await self.play_game()
+
+
+async def main(args) -> None:
+    stats = Stats()
+    in_process = args.url is None
+
+    if in_process:
+        if args.fakeredis:
+            import fakeredis
+            import redis_client
+            redis_client.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        install_redis_counters(stats)
+
+        import lobby
+        import main as app_main
+        lobby.NUMBER_CALL_INTERVAL = args.call_interval
+        lobby.FORMING_TIMEOUT = args.forming_timeout
+        await app_main.startup()
+        transport = httpx.ASGITransport(app=app_main.app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadtest")
+    else:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30.0)
+
+    deadline = time.monotonic() + args.duration
+    players = [Player(client, stats, f"load_{i}_{random.getrandbits(32):08x}", args) for i in range(args.players)]
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(player.run(deadline)) for player in players]
+    # Let in-flight games wind down, but don't wait forever on the last ones
+    await asyncio.wait(tasks, timeout=args.duration + 60)
+    for task in tasks:
+        task.cancel()
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+
+    stats.report(elapsed, count_redis=in_process)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--fakeredis", action="store_true", help="In-process only: use fakeredis instead of REDIS_URL")
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to keep starting new games")
+    parser.add_argument("--poll-interval", type=float, default=1.5, help="Matches the frontend POLL_INTERVAL")
+    parser.add_argument("--submit-delay", type=float, default=2.0, help="Max think time before submitting a grid")
+    parser.add_argument("--call-interval", type=float, default=3.0, help="In-process only: NUMBER_CALL_INTERVAL")
+    parser.add_argument("--forming-timeout", type=float, default=10.0, help="In-process only: FORMING_TIMEOUT")
+    asyncio.run(main(parser.parse_args()))
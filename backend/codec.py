@@ -0,0 +1,44 @@
+"""Compact string encodings for grids and called-number sequences stored in Redis.
+
+Every pool number 1..MAX_NUMBER is stored as one character, ``chr(n)``, so a
+grid is 10 bytes and a called sequence grows by one byte per call (APPEND).
+Staying in ASCII keeps that one byte on the wire and lets the values pass
+through the client's decode_responses, so MAX_NUMBER must stay below 128.
+Encoded values start with a format character so later formats can be told
+apart.
+
+Values written before this codec existed are still read: grids were JSON
+strings, and called numbers were a Redis list (the Lua scripts convert the list
+on first touch, see ``scripts._CODEC``).
+"""
+import json
+from typing import Iterable, List
+
+FORMAT_V1 = "A"
+
+
+def encode_numbers(numbers: Iterable[int]) -> str:
+    """Encode a number sequence, format character included."""
+    return FORMAT_V1 + "".join(map(chr, numbers))
+
+
+def decode_numbers(raw: str) -> List[int]:
+    """Decode a number sequence; an empty or missing value is an empty sequence."""
+    if not raw:
+        return []
+    if raw[0] == FORMAT_V1:
+        return list(raw[1:].encode())
+    raise ValueError(f"Unknown number encoding {raw[0]!r}")
+
+
+def encode_grid(grid: List[List[int]]) -> str:
+    """Encode a 3x3 grid row-major."""
+    return encode_numbers(n for row in grid for n in row)
+
+
+def decode_grid(raw: str) -> List[List[int]]:
+    """Decode a grid, accepting the legacy JSON form."""
+    if raw.startswith("["):
+        return json.loads(raw)
+    flat = decode_numbers(raw)
+    return [flat[i:i + 3] for i in range(0, len(flat), 3)]
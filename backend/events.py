@@ -0,0 +1,108 @@
+"""Lobby event fan-out over Redis pub/sub.
+
+Writers publish compact JSON deltas on ``lobby:{id}:events`` (the Lua transition
+scripts publish on ``KEYS[1] .. ':events'``, which is the same channel). Each
+worker holds a single pub/sub connection and fans messages out to local
+listener queues, so any number of clients watching one lobby cost one Redis
+subscription per worker.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set, Union
+
+from redis_client import lobby_key, redis
+
+LISTENER_QUEUE_SIZE = 64
+
+# Lobby-list changes (create/join/leave/start/finish); the message is the lobby id.
+LOBBIES_CHANNEL = "lobbies:events"
+
+# Sent to a listener that fell too far behind; the client should refetch status.
+RESYNC_EVENT = json.dumps({"type": "resync"})
+
+
+def lobby_channel(lobby_id: str) -> str:
+    return lobby_key(lobby_id, "events")
+
+
+def announce_lobby_change(pipe, lobby_id: str) -> None:
+    """Queue a lobby-list change notification on a pipeline."""
+    pipe.publish(LOBBIES_CHANNEL, lobby_id)
+
+
+class EventHub:
+    """Per-worker multiplexer from Redis channels to in-process listener queues."""
+
+    def __init__(self):
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._listeners: Dict[str, Set[asyncio.Queue]] = {}
+        self._pattern_listeners: Dict[str, Set[asyncio.Queue]] = {}
+        self._lock = asyncio.Lock()
+
+    def listen(self, lobby_id: str):
+        """Yield a queue receiving the raw JSON of every event published for a lobby."""
+        return self.listen_channel(lobby_channel(lobby_id))
+
+    def listen_channel(self, channel: str):
+        """Yield a queue receiving every message published on a channel."""
+        return self._listen(channel, pattern=False)
+
+    def listen_pattern(self, pattern: str):
+        """Yield a queue receiving ``(channel, message)`` for every channel matching a glob-style pattern."""
+        return self._listen(pattern, pattern=True)
+
+    @asynccontextmanager
+    async def _listen(self, name: str, pattern: bool) -> AsyncIterator[asyncio.Queue]:
+        registry = self._pattern_listeners if pattern else self._listeners
+        queue: asyncio.Queue = asyncio.Queue(maxsize=LISTENER_QUEUE_SIZE)
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            if name not in registry:
+                registry[name] = set()
+                await (self._pubsub.psubscribe(name) if pattern else self._pubsub.subscribe(name))
+            registry[name].add(queue)
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read_loop())
+        try:
+            yield queue
+        finally:
+            async with self._lock:
+                listeners = registry.get(name)
+                if listeners is not None:
+                    listeners.discard(queue)
+                    if not listeners:
+                        del registry[name]
+                        await (self._pubsub.punsubscribe(name) if pattern else self._pubsub.unsubscribe(name))
+
+    async def _read_loop(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(1.0)  # Connection dropped; redis-py resubscribes on reconnect
+                continue
+            if message is None:
+                continue
+            if message["type"] == "message":
+                self._dispatch(self._listeners.get(message["channel"], ()), message["data"])
+            elif message["type"] == "pmessage":
+                self._dispatch(self._pattern_listeners.get(message["pattern"], ()),
+                               (message["channel"], message["data"]))
+
+    @staticmethod
+    def _dispatch(queues: Set[asyncio.Queue], data: Union[str, tuple]) -> None:
+        for queue in queues:
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+
+
+event_hub = EventHub()
@@ -0,0 +1,122 @@
+"""Leader election over a Redis lease, for background work one worker should own.
+
+Every worker process runs ``leader.run()``. The worker holding the ``leader``
+key runs the background duties (lobby pool set-up, the scheduler and the
+reaper) and renews the key every LEADER_LEASE_SECONDS / 3; the others retry on
+the same period. If the leader dies its lease runs out and another worker takes
+over; on a clean shutdown it releases the lease so one does at once. A leader
+that cannot renew in time stops its duties before the lease can have passed to
+someone else. Scheduler jobs keep their own leases, so a job in flight during a
+handover is neither lost nor run twice.
+
+LEADER_LEASE_SECONDS  default 10
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, List, Optional
+
+from redis_client import redis
+from scripts import register
+
+LEADER_KEY = "leader"
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "10"))
+
+logger = logging.getLogger(__name__)
+
+Duty = Callable[[], Awaitable[None]]
+
+# KEYS: leader key
+# ARGV: token, lease_ms
+# Extends the lease only if we still hold it.
+_RENEW = register("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+# KEYS: leader key
+# ARGV: token
+_RELEASE = register("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+class LeaderElection:
+    def __init__(self, duties: List[Duty]):
+        self.duties = duties
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+        self._lease_until = 0.0  # monotonic
+
+    @property
+    def is_leader(self) -> bool:
+        return bool(self._tasks)
+
+    async def _acquire_or_renew(self) -> bool:
+        lease_ms = int(LEADER_LEASE_SECONDS * 1000)
+        if self.is_leader:
+            return bool(await _RENEW(keys=[LEADER_KEY], args=[self.token, lease_ms]))
+        return bool(await redis.set(LEADER_KEY, self.token, nx=True, px=lease_ms))
+
+    def _take_over(self) -> None:
+        logger.info("Worker %s became leader", self.token)
+        self._tasks = [asyncio.create_task(duty()) for duty in self.duties]
+
+    def _step_down(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def run(self) -> None:
+        """Contend for leadership forever, running the duties while leader."""
+        while True:
+            # Measured before the request: the lease may have started any time after this
+            attempt_at = time.monotonic()
+            try:
+                held = await self._acquire_or_renew()
+            except Exception:
+                logger.exception("Leader lease check failed")
+                # Keep leading only if the lease surely outlasts the next attempt
+                held = self.is_leader and time.monotonic() + LEADER_LEASE_SECONDS / 3 < self._lease_until
+            else:
+                if held:
+                    self._lease_until = attempt_at + LEADER_LEASE_SECONDS
+            if held and not self.is_leader:
+                self._take_over()
+            elif not held and self.is_leader:
+                logger.warning("Worker %s lost leadership", self.token)
+                self._step_down()
+            await asyncio.sleep(LEADER_LEASE_SECONDS / 3)
+
+    async def release(self) -> None:
+        """Stop the duties and hand the lease over immediately (on shutdown)."""
+        if self.is_leader:
+            self._step_down()
+            await _RELEASE(keys=[LEADER_KEY], args=[self.token])
+
+
+election: Optional[LeaderElection] = None
+
+
+def start(duties: List[Duty]) -> None:
+    """Start contending for leadership in this worker."""
+    global election
+    election = LeaderElection(duties)
+    asyncio.create_task(election.run())
+
+
+def is_leader() -> bool:
+    return election is not None and election.is_leader
+
+
+async def release() -> None:
+    if election is not None:
+        await election.release()
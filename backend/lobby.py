@@ -1,11 +1,19 @@
-import uuid
-import json
 import asyncio
+import uuid
 import random
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 
-from redis_client import redis
+from redis.exceptions import NoScriptError
+
+from redis_client import REDIS_CLUSTER, lobby_key, no_retry, redis
+import codec
+import events
+import scheduler
+import scripts
+from metrics import operation
+from scripts import queue_script, run_transition
 
 import os
 
@@ -16,8 +24,20 @@ NUMBER_CALL_INTERVAL = 3  # 3 seconds
 LOBBY_TTL = 600  # 10 minutes
 MAX_NUMBER = 20
 BUY_IN_AMOUNT = 3500  # Fixed buy-in per player
+# "manual": players claim via /claim. "auto": the server daubs every grid as
+# numbers are called and settles the first completed line itself.
+DAUB_MODE = os.getenv("DAUB_MODE", "manual")
+# Empty forming lobbies kept open; raise it to absorb bursts of players joining at once
+WARM_EMPTY_LOBBIES = int(os.getenv("WARM_EMPTY_LOBBIES", "1"))
 
 ACTIVE_LOBBIES_KEY = "active_lobbies"
+# Ids of forming lobbies with no players, maintained on every transition into or out of that state
+EMPTY_LOBBIES_KEY = "empty_lobbies"
+# Lobby name pool (see scripts.ALLOCATE_NAME); hash-tagged so the scripts stay on one cluster slot
+FREE_NAMES_KEY = "{lobby_names}:free"
+NAMES_IN_USE_KEY = "{lobby_names}:in_use"
+NAME_OVERFLOW_KEY = "{lobby_names}:overflow"
+NAMES_SEEDED_KEY = "{lobby_names}:seeded"
 
 CELESTIAL_NAMES = [
     "Andromeda", "Orion", "Nebula", "Pulsar", "Quasar", "Vega", "Sirius",
@@ -30,203 +50,183 @@ CELESTIAL_NAMES = [
 
 # --- Multi-Lobby Management ---
 
-async def _pick_lobby_name() -> str:
-    """Pick a celestial name not currently used by any active lobby."""
-    active_ids = await redis.smembers(ACTIVE_LOBBIES_KEY)
-    used_names = set()
-    for lid in active_ids:
-        name = await redis.hget(f"lobby:{lid}", "name")
-        if name:
-            used_names.add(name)
-    for name in CELESTIAL_NAMES:
-        if name not in used_names:
-            return name
-    return f"Cosmos-{random.randint(100, 999)}"
-
-
+async def _seed_lobby_names() -> None:
+    """Fill the name pool on first start, leaving out names active lobbies already use."""
+    if await redis.exists(NAMES_SEEDED_KEY):
+        return
+    active_ids = list(await redis.smembers(ACTIVE_LOBBIES_KEY))
+    async with redis.pipeline(transaction=False) as pipe:
+        for lid in active_ids:
+            pipe.hget(lobby_key(lid), "name")
+        names = await pipe.execute()
+    in_use = {name: lid for lid, name in zip(active_ids, names) if name in CELESTIAL_NAMES}
+    free = [name for name in CELESTIAL_NAMES if name not in in_use]
+    pairs = [value for name, lid in in_use.items() for value in (lid, name)]
+    await scripts.SEED_NAMES(keys=[FREE_NAMES_KEY, NAMES_IN_USE_KEY, NAMES_SEEDED_KEY],
+                             args=[len(free), *free, *pairs])
+
+
+async def _allocate_lobby_name(lobby_id: str) -> str:
+    """Take a free celestial name, or an overflow name once all are in use."""
+    name = await scripts.ALLOCATE_NAME(keys=[FREE_NAMES_KEY, NAMES_IN_USE_KEY, NAME_OVERFLOW_KEY], args=[lobby_id])
+    if isinstance(name, str):
+        return name
+    base, cycle = divmod(name - 1, len(CELESTIAL_NAMES))
+    return f"{CELESTIAL_NAMES[cycle]} {base + 2}"
+
+
+async def release_lobby_names(lobby_ids: List[str]) -> None:
+    """Return the names of finished or removed lobbies to the pool."""
+    if lobby_ids:
+        await scripts.RELEASE_NAMES(keys=[FREE_NAMES_KEY, NAMES_IN_USE_KEY], args=lobby_ids)
+
+
+@operation
 async def create_lobby() -> dict:
     """Create a new forming lobby with a celestial name."""
     lobby_id = f"lobby_{uuid.uuid4().hex[:8]}"
-    name = await _pick_lobby_name()
-
-    await redis.hset(f"lobby:{lobby_id}", mapping={
-        "lobby_id": lobby_id,
-        "name": name,
-        "status": "forming",
-        "buy_in_amount": str(BUY_IN_AMOUNT),
-        "pot": "0",
-        "winner": "",
-        "created_at": datetime.utcnow().isoformat(),
-        "forming_deadline": "",
-        "started_at": "",
-        "finished_at": "",
-    })
-    await redis.expire(f"lobby:{lobby_id}", LOBBY_TTL)
-    await redis.sadd(ACTIVE_LOBBIES_KEY, lobby_id)
+    name = await _allocate_lobby_name(lobby_id)
+
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(lobby_key(lobby_id), mapping={
+            "lobby_id": lobby_id,
+            "name": name,
+            "status": "forming",
+            "buy_in_amount": str(BUY_IN_AMOUNT),
+            "pot": "0",
+            "winner": "",
+            "created_at": datetime.utcnow().isoformat(),
+            "forming_deadline": "",
+            "started_at": "",
+            "finished_at": "",
+            "player_count": "0",
+            "ready_count": "0",
+            "active_count": "0",
+            "version": "0",
+            "daub_mode": DAUB_MODE,
+        })
+        pipe.expire(lobby_key(lobby_id), LOBBY_TTL)
+        pipe.sadd(ACTIVE_LOBBIES_KEY, lobby_id)
+        pipe.sadd(EMPTY_LOBBIES_KEY, lobby_id)
+        events.announce_lobby_change(pipe, lobby_id)
+        await pipe.execute()
     return {"lobby_id": lobby_id, "name": name, "status": "forming", "player_count": 0, "pot": 0}
 
 
+@operation
 async def ensure_empty_lobby_exists() -> None:
-    """Ensure exactly one empty forming lobby exists. Remove extras."""
-    active_ids = await redis.smembers(ACTIVE_LOBBIES_KEY)
-    empty_lobbies = []
+    """Top the empty forming lobbies up to WARM_EMPTY_LOBBIES, or discard extras.
+
+    Costs one SCARD while the pool is at its target, however many lobbies are active.
+    """
+    missing = WARM_EMPTY_LOBBIES - await redis.scard(EMPTY_LOBBIES_KEY)
+    if missing > 0:
+        await asyncio.gather(*(create_lobby() for _ in range(missing)))
+    elif missing < 0:
+        # SPOP so concurrent callers never pick the same extra
+        await _discard_empty_lobbies(await redis.spop(EMPTY_LOBBIES_KEY, -missing))
+
+
+async def _discard_empty_lobbies(lobby_ids: List[str]) -> None:
+    """Delete lobbies already taken out of the empty set, unless a player joined meanwhile."""
+    discarded = []
+    for lid in lobby_ids:
+        if await scripts.DISCARD_EMPTY_LOBBY(keys=[lobby_key(lid), lobby_key(lid, "players")]):
+            discarded.append(lid)
+    if not discarded:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.srem(ACTIVE_LOBBIES_KEY, *discarded)
+        for lid in discarded:
+            events.announce_lobby_change(pipe, lid)
+        await pipe.execute()
+    await release_lobby_names(discarded)
 
-    for lid in active_ids:
-        lobby = await redis.hgetall(f"lobby:{lid}")
-        if not lobby or lobby.get("status") == "finished":
-            await redis.srem(ACTIVE_LOBBIES_KEY, lid)
-            continue
-        if lobby.get("status") == "forming":
-            player_keys = await redis.keys(f"lobby:{lid}:player:*")
-            if len(player_keys) == 0:
-                empty_lobbies.append(lid)
 
-    if len(empty_lobbies) == 0:
-        await create_lobby()
-    elif len(empty_lobbies) > 1:
-        # Keep the first, remove the rest
-        for lid in empty_lobbies[1:]:
-            await redis.delete(f"lobby:{lid}")
-            await redis.srem(ACTIVE_LOBBIES_KEY, lid)
+_SUMMARY_FIELDS = ("lobby_id", "name", "status", "player_count", "pot", "buy_in_amount")
 
 
+@operation
 async def list_lobbies() -> list:
-    """Return all active lobbies (forming/active) with summary info."""
+    """Return all active lobbies (forming/active) with summary info.
+
+    Read-only: stale ids of finished or expired lobbies are skipped here and
+    removed by the reaper. Prefer lobby_cache.get_lobbies() on request paths.
+    """
     active_ids = await redis.smembers(ACTIVE_LOBBIES_KEY)
+    async with redis.pipeline(transaction=False) as pipe:
+        for lid in active_ids:
+            pipe.hmget(lobby_key(lid), _SUMMARY_FIELDS)
+        results = await pipe.execute()
+
     lobbies = []
-    for lid in active_ids:
-        lobby = await redis.hgetall(f"lobby:{lid}")
-        if not lobby:
-            await redis.srem(ACTIVE_LOBBIES_KEY, lid)
+    for values in results:
+        lobby = dict(zip(_SUMMARY_FIELDS, values))
+        if not lobby["status"] or lobby["status"] == "finished":
             continue
-        if lobby["status"] == "finished":
-            await redis.srem(ACTIVE_LOBBIES_KEY, lid)
-            continue
-        player_keys = await redis.keys(f"lobby:{lid}:player:*")
         lobbies.append({
             "lobby_id": lobby["lobby_id"],
-            "name": lobby.get("name", "Unknown"),
+            "name": lobby["name"] or "Unknown",
             "status": lobby["status"],
-            "player_count": len(player_keys),
+            "player_count": int(lobby["player_count"] or 0),
             "max_players": MAX_PLAYERS,
-            "pot": int(lobby.get("pot", 0)),
-            "buy_in_amount": int(lobby.get("buy_in_amount", BUY_IN_AMOUNT)),
+            "pot": int(lobby["pot"] or 0),
+            "buy_in_amount": int(lobby["buy_in_amount"] or BUY_IN_AMOUNT),
         })
     return lobbies
 
 
+@operation
 async def initialize_lobbies() -> None:
-    """Called on app startup to ensure at least one empty lobby exists."""
+    """Called on app startup to seed the name pool and ensure an empty lobby exists."""
+    await _seed_lobby_names()
     await ensure_empty_lobby_exists()
 
 
 # --- Player Joining ---
 
+@operation
 async def add_player_to_lobby(lobby_id: str, alien_id: str) -> dict:
     """Add a player to a lobby. Returns lobby info."""
-    lobby = await redis.hgetall(f"lobby:{lobby_id}")
-    if not lobby:
-        raise ValueError("Lobby not found")
-
-    if lobby["status"] != "forming":
-        raise ValueError("Lobby is no longer accepting players")
-
-    # Check if player is already in this lobby — return current state
-    exists = await redis.exists(f"lobby:{lobby_id}:player:{alien_id}")
-    if exists:
-        player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
-        return {
-            "lobby_id": lobby_id,
-            "status": lobby["status"],
-            "player_count": len(player_keys),
-            "pot": int(lobby["pot"]),
-        }
+    deadline = datetime.utcnow() + timedelta(seconds=FORMING_TIMEOUT)
+    result, action = await run_transition(
+        scripts.JOIN_LOBBY,
+        keys=[lobby_key(lobby_id), lobby_key(lobby_id, "players"), lobby_key(lobby_id, "player", alien_id)],
+        args=[alien_id, MAX_PLAYERS, BUY_IN_AMOUNT, LOBBY_TTL, datetime.utcnow().isoformat(), deadline.isoformat()],
+    )
 
-    # Check capacity
-    player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
-    if len(player_keys) >= MAX_PLAYERS:
-        raise ValueError("Lobby is full")
-
-    # Add player
-    await redis.hset(f"lobby:{lobby_id}:player:{alien_id}", mapping={
-        "alien_id": alien_id,
-        "numbers": "[]",
-        "grid": "[]",
-        "ready": "false",
-        "active": "true",
-        "joined_at": datetime.utcnow().isoformat(),
-    })
-    await redis.expire(f"lobby:{lobby_id}:player:{alien_id}", LOBBY_TTL)
-
-    player_count = len(player_keys) + 1
-    pot = int(lobby["pot"])
-
-    # Auto-credit buy-in
-    await redis.hincrby(f"lobby:{lobby_id}", "pot", BUY_IN_AMOUNT)
-    pot += BUY_IN_AMOUNT
-
-    # Start forming timer on first player join
-    if not lobby.get("forming_deadline"):
-        deadline = (datetime.utcnow() + timedelta(seconds=FORMING_TIMEOUT)).isoformat()
-        await redis.hset(f"lobby:{lobby_id}", "forming_deadline", deadline)
-        asyncio.create_task(forming_timer(lobby_id))
-
-    # Ensure a new empty lobby is available after this join
-    await ensure_empty_lobby_exists()
+    # First player joined: start the forming timer and replace the lobby in the empty pool
+    if action == "start_timer":
+        await scheduler.schedule("forming", lobby_id, _utc_timestamp(deadline))
+        await redis.srem(EMPTY_LOBBIES_KEY, lobby_id)
+        await ensure_empty_lobby_exists()
 
-    return {
-        "lobby_id": lobby_id,
-        "status": lobby["status"],
-        "player_count": player_count,
-        "pot": pot,
-    }
+    return result
 
 
+@operation
 async def remove_player_from_lobby(lobby_id: str, alien_id: str) -> dict:
     """Remove a player from a forming lobby and refund buy-in."""
-    lobby = await redis.hgetall(f"lobby:{lobby_id}")
-    if not lobby:
-        raise ValueError("Lobby not found")
+    result, action = await run_transition(
+        scripts.LEAVE_LOBBY,
+        keys=[lobby_key(lobby_id), lobby_key(lobby_id, "players"), lobby_key(lobby_id, "player", alien_id)],
+        args=[alien_id, BUY_IN_AMOUNT],
+    )
 
-    if lobby["status"] != "forming":
-        raise ValueError("Cannot leave a game in progress")
+    # Last player left: the lobby is empty again, so the pool may now hold one too many
+    if action == "cancel_timer":
+        await scheduler.cancel("forming", lobby_id)
+        await redis.sadd(EMPTY_LOBBIES_KEY, lobby_id)
+        await ensure_empty_lobby_exists()
 
-    exists = await redis.exists(f"lobby:{lobby_id}:player:{alien_id}")
-    if not exists:
-        raise ValueError("Player not in this lobby")
-
-    # Remove player
-    await redis.delete(f"lobby:{lobby_id}:player:{alien_id}")
-
-    # Refund buy-in
-    await redis.hincrby(f"lobby:{lobby_id}", "pot", -BUY_IN_AMOUNT)
-
-    # If lobby is now empty, clean up extra empties
-    player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
-    if len(player_keys) == 0:
-        # Reset forming deadline since no players left
-        await redis.hset(f"lobby:{lobby_id}", "forming_deadline", "")
-
-    await ensure_empty_lobby_exists()
-
-    return {"success": True}
+    return result
 
 
 # --- Submit Grid (combined select + arrange) ---
 
+@operation
 async def submit_grid(lobby_id: str, alien_id: str, grid: List[List[int]]) -> dict:
     """Store player's grid (numbers + arrangement in one step). Marks player ready."""
-    lobby = await redis.hgetall(f"lobby:{lobby_id}")
-    if not lobby:
-        raise ValueError("Lobby not found")
-
-    if lobby["status"] != "forming":
-        raise ValueError("Cannot submit grid in current game state")
-
-    player = await redis.hgetall(f"lobby:{lobby_id}:player:{alien_id}")
-    if not player:
-        raise ValueError("Player not in this lobby")
-
     # Validate grid structure
     if len(grid) != 3 or any(len(row) != 3 for row in grid):
         raise ValueError("Grid must be 3x3")
@@ -238,48 +238,28 @@ async def submit_grid(lobby_id: str, alien_id: str, grid: List[List[int]]) -> di
     if not all(1 <= n <= MAX_NUMBER for n in flat):
         raise ValueError(f"Numbers must be between 1 and {MAX_NUMBER}")
 
-    # Store numbers and grid, mark ready
-    await redis.hset(f"lobby:{lobby_id}:player:{alien_id}", mapping={
-        "numbers": json.dumps(flat),
-        "grid": json.dumps(grid),
-        "ready": "true",
-    })
+    # Store numbers and grid, mark ready, and start the game if everyone is ready
+    result, action = await run_transition(
+        scripts.SUBMIT_GRID,
+        keys=[lobby_key(lobby_id), lobby_key(lobby_id, "player", alien_id), lobby_key(lobby_id, "draw_order")],
+        args=[codec.encode_grid(grid), MIN_PLAYERS, datetime.utcnow().isoformat(), LOBBY_TTL,
+              "0", alien_id, _draw_order(), _line_masks_csv(grid)],
+    )
 
-    # Check if all players are ready → start game immediately
-    player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
-    if len(player_keys) >= MIN_PLAYERS:
-        all_ready = await check_all_players_ready(lobby_id)
-        if all_ready:
-            await start_game(lobby_id)
+    if action == "start_game":
+        await _schedule_number_calls(lobby_id)
 
-    ready_count = await _count_ready_players(lobby_id)
-
-    return {
-        "success": True,
-        "ready_count": ready_count,
-        "message": "Grid submitted. Waiting for other players.",
-    }
+    return result
 
 
-async def check_all_players_ready(lobby_id: str) -> bool:
-    """Check if all active players have submitted their grid."""
-    player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
-    for key in player_keys:
-        player = await redis.hgetall(key)
-        if player.get("active") == "true" and player.get("ready") != "true":
-            return False
-    return True
-
-
-async def _count_ready_players(lobby_id: str) -> int:
-    """Count players who have submitted their grid."""
-    player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
-    count = 0
-    for key in player_keys:
-        player = await redis.hgetall(key)
-        if player.get("ready") == "true" and player.get("active") == "true":
-            count += 1
-    return count
+async def _get_players(lobby_id: str) -> List[dict]:
+    """Fetch every player hash in a lobby via the per-lobby player index."""
+    alien_ids = await redis.smembers(lobby_key(lobby_id, "players"))
+    async with redis.pipeline(transaction=False) as pipe:
+        for aid in alien_ids:
+            pipe.hgetall(lobby_key(lobby_id, "player", aid))
+        results = await pipe.execute()
+    return [player for player in results if player]
 
 
 # --- Timers & State Transitions ---
@@ -290,227 +270,349 @@ def _generate_random_grid() -> List[List[int]]:
     return [nums[0:3], nums[3:6], nums[6:9]]
 
 
-async def forming_timer(lobby_id: str):
-    """2-minute countdown. When it expires, auto-submit random grids for unready players and start."""
-    await asyncio.sleep(FORMING_TIMEOUT)
+def _draw_order() -> str:
+    """Shuffle the number pool for a game, comma-separated for the start scripts."""
+    numbers_pool = list(range(1, MAX_NUMBER + 1))
+    random.shuffle(numbers_pool)
+    return ",".join(map(str, numbers_pool))
+
+
+def _line_masks_csv(grid: List[List[int]]) -> str:
+    """Winning-line masks of a grid, comma-separated for the submit script."""
+    return ",".join(map(str, grid_line_masks(grid)))
 
-    lobby = await redis.hgetall(f"lobby:{lobby_id}")
-    if not lobby or lobby["status"] != "forming":
-        return
+
+def _utc_timestamp(moment: datetime) -> float:
+    """Unix time of a naive UTC datetime."""
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+@operation
+async def forming_deadline_tick(lobby_id: str) -> Optional[float]:
+    """Forming deadline reached: auto-submit random grids for unready players and start."""
+    lobby = await redis.hgetall(lobby_key(lobby_id))
+    if not lobby or lobby["status"] != "forming" or not lobby.get("forming_deadline"):
+        return None
+
+    # The deadline was reset (everyone left) and set again by a later join
+    deadline = _utc_timestamp(datetime.fromisoformat(lobby["forming_deadline"]))
+    if deadline > time.time():
+        return deadline
 
     # Auto-submit random grids for unready players
-    player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
-    for key in player_keys:
-        player = await redis.hgetall(key)
+    for player in await _get_players(lobby_id):
         if player.get("active") == "true" and player.get("ready") != "true":
             grid = _generate_random_grid()
-            flat = [n for row in grid for n in row]
-            await redis.hset(key, mapping={
-                "numbers": json.dumps(flat),
-                "grid": json.dumps(grid),
-                "ready": "true",
-            })
+            try:
+                _, action = await run_transition(
+                    scripts.SUBMIT_GRID,
+                    keys=[lobby_key(lobby_id), lobby_key(lobby_id, "player", player["alien_id"]),
+                          lobby_key(lobby_id, "draw_order")],
+                    args=[codec.encode_grid(grid), MIN_PLAYERS, datetime.utcnow().isoformat(),
+                          LOBBY_TTL, "1", player["alien_id"], _draw_order(), _line_masks_csv(grid)],
+                )
+            except ValueError:
+                continue  # Player left or the lobby moved on
+            if action == "start_game":
+                await _schedule_number_calls(lobby_id)
+                return None
 
     # All players now have grids — start if enough players
-    active_keys = []
-    for key in player_keys:
-        player = await redis.hgetall(key)
-        if player.get("active") == "true":
-            active_keys.append(key)
+    active_count = int(await redis.hget(lobby_key(lobby_id), "active_count") or 0)
 
-    if len(active_keys) >= MIN_PLAYERS:
+    if active_count >= MIN_PLAYERS:
         await start_game(lobby_id)
     else:
         await finish_game(lobby_id, winner=None)
+    return None
 
 
+@operation
 async def start_game(lobby_id: str):
     """Transition to active state and start calling numbers."""
-    lock_acquired = await redis.set(f"lobby:{lobby_id}:starting", "1", nx=True, ex=30)
-    if not lock_acquired:
-        return
+    _, action = await run_transition(
+        scripts.START_GAME,
+        keys=[lobby_key(lobby_id), lobby_key(lobby_id, "draw_order")],
+        args=[_draw_order(), datetime.utcnow().isoformat(), LOBBY_TTL],
+    )
+    if action == "start_game":
+        await _schedule_number_calls(lobby_id)
 
-    current_status = await redis.hget(f"lobby:{lobby_id}", "status")
-    if current_status != "forming":
-        return
-
-    await redis.hset(f"lobby:{lobby_id}", mapping={
-        "status": "active",
-        "started_at": datetime.utcnow().isoformat(),
-    })
 
-    await redis.expire(f"lobby:{lobby_id}", LOBBY_TTL)
-
-    asyncio.create_task(call_numbers_task(lobby_id))
+# --- Number Calling ---
 
+async def _schedule_number_calls(lobby_id: str):
+    """Hand a started game to the scheduler; the first number is called right away."""
+    await scheduler.schedule("call", lobby_id, time.time())
+
+
+def _call_number_keys(lobby_id: str) -> List[str]:
+    return [
+        lobby_key(lobby_id), lobby_key(lobby_id, "numbers_called"),
+        lobby_key(lobby_id, "called_versions"), lobby_key(lobby_id, "draw_order"), lobby_key(lobby_id, "daub"),
+    ]
+
+
+@operation
+async def call_number_batch(lobby_ids: List[str]) -> List[Optional[float]]:
+    """Call the next number for every due lobby in one pipelined round trip.
+
+    Returns when each lobby's next call is due (None once its game is over).
+    Lobbies due in the same pass share a next-due time, so they stay batched.
+    A lobby whose call fails gets its exception instead, and only its job is
+    left for a later pass; the rest of the batch completes normally.
+    """
+    async def call_all():
+        called_at = datetime.utcnow().isoformat()
+        async with redis.pipeline(transaction=False) as pipe:
+            for lid in lobby_ids:
+                queue_script(pipe, scripts.CALL_NUMBER, keys=_call_number_keys(lid), args=[called_at])
+            with no_retry():
+                return await pipe.execute(raise_on_error=False)
+
+    numbers = await call_all()
+    if numbers and all(isinstance(number, NoScriptError) for number in numbers):
+        # Nothing ran: the script cache was flushed
+        await scripts.load_scripts()
+        numbers = await call_all()
+
+    next_due = time.time() + NUMBER_CALL_INTERVAL
+    results = []
+    for lobby_id, number in zip(lobby_ids, numbers):
+        if isinstance(number, Exception):
+            results.append(number)
+            continue
+        try:
+            if number == 0:
+                results.append(None)  # Game already over
+            elif number == -2:
+                # Auto-daub settled the game on this call
+                await _cleanup_finished_game(lobby_id)
+                results.append(None)
+            elif number < 0:
+                # Draw order exhausted one interval after the last call
+                await finish_game(lobby_id, winner=None)
+                results.append(None)
+            else:
+                results.append(next_due)
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+scheduler.register_handler("forming", forming_deadline_tick)
+scheduler.register_batch_handler("call", call_number_batch)
 
-# --- Number Calling ---
 
-async def call_numbers_task(lobby_id: str):
-    """Background task that calls numbers every 3 seconds."""
-    numbers_pool = list(range(1, MAX_NUMBER + 1))
-    random.shuffle(numbers_pool)
+# --- Win Verification ---
 
-    for number in numbers_pool:
-        lobby = await redis.hgetall(f"lobby:{lobby_id}")
-        if not lobby or lobby["status"] != "active":
-            return
+# Row-major cell indices of the 8 winning lines, in check order. The claim
+# script keeps its own copy of the names and order.
+WIN_LINES = (
+    ("row_0", (0, 1, 2)), ("row_1", (3, 4, 5)), ("row_2", (6, 7, 8)),
+    ("col_0", (0, 3, 6)), ("col_1", (1, 4, 7)), ("col_2", (2, 5, 8)),
+    ("diagonal_main", (0, 4, 8)), ("diagonal_anti", (2, 4, 6)),
+)
 
-        current_latest = lobby.get("latest_number", "")
 
-        await redis.rpush(f"lobby:{lobby_id}:numbers_called", str(number))
+def number_mask(numbers) -> int:
+    """Bitmask with bit n-1 set for each pool number n (MAX_NUMBER must stay below 47: Lua formats numbers with 14 digits)."""
+    mask = 0
+    for n in numbers:
+        mask |= 1 << (n - 1)
+    return mask
 
-        update = {"latest_number": str(number)}
-        if current_latest:
-            update["previous_number"] = current_latest
-        await redis.hset(f"lobby:{lobby_id}", mapping=update)
 
-        await asyncio.sleep(NUMBER_CALL_INTERVAL)
+def grid_line_masks(grid: List[List[int]]) -> List[int]:
+    """The number mask of each winning line of a grid, in WIN_LINES order."""
+    flat = [n for row in grid for n in row]
+    return [number_mask(flat[c] for c in cells) for _, cells in WIN_LINES]
 
-    await finish_game(lobby_id, winner=None)
 
+def match_line(line_masks: List[int], mask: int) -> Optional[str]:
+    """Name of the first line fully covered by ``mask``."""
+    for (name, _), line in zip(WIN_LINES, line_masks):
+        if line & mask == line:
+            return name
+    return None
 
-# --- Win Verification ---
 
 def check_win_patterns(grid: List[List[int]], numbers_called: set) -> Optional[str]:
     """Check all 8 possible winning patterns."""
-    for i in range(3):
-        if all(grid[i][j] in numbers_called for j in range(3)):
-            return f"row_{i}"
-
-    for j in range(3):
-        if all(grid[i][j] in numbers_called for i in range(3)):
-            return f"col_{j}"
-
-    if all(grid[i][i] in numbers_called for i in range(3)):
-        return "diagonal_main"
-
-    if all(grid[i][2 - i] in numbers_called for i in range(3)):
-        return "diagonal_anti"
-
-    return None
+    called_mask = number_mask(n for n in numbers_called if 1 <= n <= MAX_NUMBER)
+    return match_line(grid_line_masks(grid), called_mask)
 
 
+@operation
 async def verify_claim(lobby_id: str, alien_id: str, highlighted_numbers: List[int]) -> dict:
     """Verify a bingo claim using the player's highlighted numbers."""
-    lobby = await redis.hgetall(f"lobby:{lobby_id}")
-    if not lobby:
-        raise ValueError("Lobby not found")
-
-    if lobby["status"] != "active":
-        raise ValueError("Game is not active")
-
-    player = await redis.hgetall(f"lobby:{lobby_id}:player:{alien_id}")
-    if not player:
-        raise ValueError("Player not in this lobby")
+    in_pool = [n for n in highlighted_numbers if 1 <= n <= MAX_NUMBER]
+    stray = len(in_pool) != len(highlighted_numbers)  # Never called, so the claim is invalid
+    result, action = await run_transition(
+        scripts.CLAIM_BINGO,
+        keys=[lobby_key(lobby_id), lobby_key(lobby_id, "player", alien_id), lobby_key(lobby_id, "numbers_called")],
+        args=[alien_id, datetime.utcnow().isoformat(), number_mask(in_pool), "1" if stray else "0"],
+    )
 
-    if player.get("active") != "true":
-        raise ValueError("Player is no longer active in this game")
+    if action == "finish":
+        await _cleanup_finished_game(lobby_id)
 
-    grid = json.loads(player["grid"])
-    called_raw = await redis.lrange(f"lobby:{lobby_id}:numbers_called", 0, -1)
-    numbers_called = set(int(n) for n in called_raw)
+    return result
 
-    highlighted_set = set(highlighted_numbers)
 
-    # Check 1: Do highlighted numbers form a winning pattern on the grid?
-    pattern = check_win_patterns(grid, highlighted_set)
-
-    # Check 2: Are ALL highlighted numbers actually called?
-    all_called = highlighted_set.issubset(numbers_called)
-
-    if pattern and all_called:
-        pot = int(lobby["pot"])
-        await finish_game(lobby_id, winner=alien_id)
-        return {
-            "valid": True,
-            "winner": True,
-            "pot": pot,
-            "message": f"YOU WON! +{pot:,} Alien coins",
-            "pattern": pattern,
-        }
-    else:
-        await redis.hset(f"lobby:{lobby_id}:player:{alien_id}", "active", "false")
+@operation
+async def finish_game(lobby_id: str, winner: Optional[str]):
+    """Finish the game, set winner, clean up."""
+    await run_transition(
+        scripts.FINISH_GAME,
+        keys=[lobby_key(lobby_id)],
+        args=[winner or "", datetime.utcnow().isoformat()],
+    )
+    await _cleanup_finished_game(lobby_id)
 
-        all_kicked = await check_all_players_kicked(lobby_id)
-        if all_kicked:
-            await finish_game(lobby_id, winner=None)
 
-        return {
-            "valid": False,
-            "kicked": True,
-            "message": "Invalid claim. You've been removed from the game.",
-        }
+async def _cleanup_finished_game(lobby_id: str):
+    """Remove a finished lobby from the active set and free its name.
 
+    A game only starts with players in it, so finishing never changes the empty lobby pool.
+    """
+    await redis.srem(ACTIVE_LOBBIES_KEY, lobby_id)
+    await release_lobby_names([lobby_id])
 
-async def check_all_players_kicked(lobby_id: str) -> bool:
-    """Check if all players have been kicked."""
-    player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
-    for key in player_keys:
-        player = await redis.hgetall(key)
-        if player.get("active") == "true":
-            return False
-    return True
 
+# --- Game Status ---
 
-async def finish_game(lobby_id: str, winner: Optional[str]):
-    """Finish the game, set winner, clean up."""
-    await redis.hset(f"lobby:{lobby_id}", mapping={
-        "status": "finished",
-        "winner": winner or "",
-        "finished_at": datetime.utcnow().isoformat(),
-    })
-    # Remove from active set and ensure an empty lobby exists
-    await redis.srem(ACTIVE_LOBBIES_KEY, lobby_id)
-    await ensure_empty_lobby_exists()
+def _pairs_to_dict(flat: list) -> dict:
+    """Convert a flat [field, value, ...] reply into a dict."""
+    return dict(zip(flat[::2], flat[1::2]))
 
 
-# --- Game Status ---
+@operation
+async def get_game_status(lobby_id: str, since: int = 0, known_version: Optional[int] = None) -> Optional[dict]:
+    """Get game status for polling.
 
-async def get_game_status(lobby_id: str) -> dict:
-    """Get full game status for polling."""
-    lobby = await redis.hgetall(f"lobby:{lobby_id}")
-    if not lobby:
+    With ``since`` set, only players and called numbers that changed after that
+    version are included. Returns None if the lobby is still at ``known_version``.
+    """
+    snapshot = await scripts.STATUS_SNAPSHOT(
+        keys=[lobby_key(lobby_id), lobby_key(lobby_id, "players"),
+              lobby_key(lobby_id, "numbers_called"), lobby_key(lobby_id, "called_versions")],
+        args=[lobby_key(lobby_id, "player", ""), since, "" if known_version is None else known_version],
+    )
+    if not snapshot:
         raise ValueError("Lobby not found")
+    if len(snapshot) == 1:
+        return None
+
+    lobby_raw, players_raw, called_raw, player_ids = snapshot
+    lobby = _pairs_to_dict(lobby_raw)
 
-    player_keys = await redis.keys(f"lobby:{lobby_id}:player:*")
     players = {}
-    ready_count = 0
-    for key in player_keys:
-        player_data = await redis.hgetall(key)
+    for player_data in map(_pairs_to_dict, players_raw):
         aid = player_data["alien_id"]
         is_ready = player_data.get("ready") == "true"
-        if is_ready and player_data.get("active") == "true":
-            ready_count += 1
+        grid = codec.decode_grid(player_data.get("grid", ""))
         players[aid] = {
             "alien_id": aid,
-            "numbers": json.loads(player_data.get("numbers", "[]")),
-            "grid": json.loads(player_data.get("grid", "[]")),
+            "numbers": [n for row in grid for n in row],
+            "grid": grid,
             "ready": is_ready,
             "active": player_data.get("active") == "true",
             "joined_at": player_data.get("joined_at", ""),
         }
 
-    called_raw = await redis.lrange(f"lobby:{lobby_id}:numbers_called", 0, -1)
-    called_numbers = [int(n) for n in called_raw]
+    called_numbers = codec.decode_numbers(called_raw)
 
     time_elapsed = 0
     if lobby.get("started_at"):
         started = datetime.fromisoformat(lobby["started_at"])
         time_elapsed = int((datetime.utcnow() - started).total_seconds())
 
-    return {
+    status = {
         "lobby_id": lobby["lobby_id"],
+        "version": int(lobby.get("version", 0)),
         "status": lobby["status"],
         "buy_in_amount": int(lobby["buy_in_amount"]),
         "pot": int(lobby["pot"]),
-        "player_count": len(player_keys),
-        "ready_count": ready_count,
+        "player_count": int(lobby.get("player_count", 0)),
+        "ready_count": int(lobby.get("ready_count", 0)),
         "players": players,
         "forming_deadline": lobby.get("forming_deadline") or None,
         "latest_number": int(lobby["latest_number"]) if lobby.get("latest_number") else None,
         "previous_number": int(lobby["previous_number"]) if lobby.get("previous_number") else None,
-        "called_numbers": called_numbers,
         "winner": lobby.get("winner") or None,
+        "winning_pattern": lobby.get("winning_pattern") or None,
+        "daub_mode": lobby.get("daub_mode", "manual"),
+        "started_at": lobby.get("started_at") or None,
         "time_elapsed": time_elapsed,
     }
+    if since and since <= status["version"]:
+        # Delta: changed players only, plus the full id list so clients can drop leavers
+        status["since"] = since
+        status["player_ids"] = sorted(player_ids)
+        status["new_called_numbers"] = called_numbers
+    else:
+        status["called_numbers"] = called_numbers
+    return status
+
+
+# --- Payments ---
+
+def _invoice_key(invoice_id: str) -> str:
+    return f"invoice:{invoice_id}"
+
+
+async def check_invoice(invoice_id: str) -> None:
+    """Raise ValueError for an unknown invoice."""
+    if not await redis.exists(_invoice_key(invoice_id)):
+        raise ValueError("Invoice not found")
+
+
+@operation
+async def settle_invoice(invoice_id: str) -> bool:
+    """Credit a finalized invoice to its lobby's pot exactly once.
+
+    On standalone Redis this is one SETTLE_INVOICE call. In cluster mode the
+    invoice is read first and marked finalized only after CREDIT_INVOICE ran,
+    so a delivery retried after a crash in between finishes the job without
+    crediting twice. Returns False for a repeat delivery; raises ValueError for
+    an unknown invoice.
+    """
+    if not REDIS_CLUSTER:
+        prefix, _, suffix = lobby_key("\0").partition("\0")
+        settled = await scripts.SETTLE_INVOICE(keys=[_invoice_key(invoice_id)], args=[prefix, suffix, invoice_id])
+        if settled < 0:
+            raise ValueError("Invoice not found")
+        return bool(settled)
+
+    invoice = await redis.hgetall(_invoice_key(invoice_id))
+    if not invoice or not invoice.get("lobby_id"):
+        raise ValueError("Invoice not found")
+    if invoice.get("status") == "finalized":
+        return False
+
+    lobby_id = invoice["lobby_id"]
+    credited = await scripts.CREDIT_INVOICE(
+        keys=[lobby_key(lobby_id), lobby_key(lobby_id, "invoices")],
+        args=[invoice_id, invoice.get("alien_id", ""), int(invoice["amount"])],
+    )
+    await redis.hset(_invoice_key(invoice_id), "status", "finalized")
+    return bool(credited)
+
+
+_LEDGER_SIGNS = {"buy_in": 1, "payment": 1, "refund": -1, "payout": 0}
+
+
+@operation
+async def replay_ledger(lobby_id: str) -> dict:
+    """Rebuild a lobby's pot from its ledger stream.
+
+    Payouts leave the pot figure as it was (it shows what was won), so they are
+    totalled separately.
+    """
+    entries = [fields for _, fields in await redis.xrange(lobby_key(lobby_id, "ledger"))]
+    return {
+        "pot": sum(_LEDGER_SIGNS[e["type"]] * int(e["amount"]) for e in entries),
+        "paid_out": sum(int(e["amount"]) for e in entries if e["type"] == "payout"),
+        "entries": entries,
+    }
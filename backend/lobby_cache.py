@@ -0,0 +1,65 @@
+"""Per-worker cache of the lobby list served by GET /api/lobbies.
+
+Lobby create/join/leave/start/finish publish on events.LOBBIES_CHANNEL, which
+marks the cached list dirty. A dirty list is rebuilt at most once per
+MIN_REBUILD_INTERVAL, and a clean one is still rebuilt after MAX_STALENESS in
+case a notification was lost.
+"""
+import asyncio
+import time
+from typing import Optional
+
+from events import LOBBIES_CHANNEL, event_hub
+from lobby import list_lobbies
+
+MAX_STALENESS = 5.0  # seconds
+MIN_REBUILD_INTERVAL = 0.25  # seconds
+
+
+class LobbyListCache:
+    def __init__(self):
+        self._lobbies: Optional[list] = None
+        self._built_at = 0.0
+        self._built_generation = -1
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._watcher: Optional[asyncio.Task] = None
+
+    def invalidate(self) -> None:
+        self._generation += 1
+
+    def _is_fresh(self) -> bool:
+        if self._lobbies is None:
+            return False
+        age = time.monotonic() - self._built_at
+        if self._built_generation != self._generation:
+            return age < MIN_REBUILD_INTERVAL
+        return age < MAX_STALENESS
+
+    async def get(self) -> list:
+        """Return the cached lobby list, rebuilding it (single-flight) when stale."""
+        if self._is_fresh():
+            return self._lobbies
+        async with self._lock:
+            if self._is_fresh():
+                return self._lobbies
+            # Changes that land while we read keep the cache dirty
+            generation = self._generation
+            self._lobbies = await list_lobbies()
+            self._built_generation = generation
+            self._built_at = time.monotonic()
+            return self._lobbies
+
+    async def _watch(self) -> None:
+        async with event_hub.listen_channel(LOBBIES_CHANNEL) as queue:
+            while True:
+                await queue.get()
+                self.invalidate()
+
+    def start(self) -> None:
+        """Start following lobby-list change notifications."""
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+
+lobby_cache = LobbyListCache()
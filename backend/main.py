@@ -1,35 +1,66 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional, Tuple
 from pathlib import Path
 import os
-import json
+import asyncio
 from dotenv import load_dotenv
 from datetime import datetime
 
-from redis_client import redis, check_redis_connection
-from auth import verify_alien_token
+import orjson
+
+from redis_client import check_redis_connection, lobby_key, pool_stats, redis
+from auth import DEV_MODE, jwks_cache, token_cache, verify_alien_token, authenticate_token
+from events import event_hub
+from lobby_cache import lobby_cache
+from reaper import run_reaper
+import leader
+import metrics
+import rate_limit
+import scheduler
+from scripts import load_scripts
+from status_cache import status_cache
 from lobby import (
-    list_lobbies,
+    ACTIVE_LOBBIES_KEY,
     initialize_lobbies,
     add_player_to_lobby,
     remove_player_from_lobby,
     submit_grid as lobby_submit_grid,
     get_game_status as lobby_get_game_status,
+    check_invoice,
+    settle_invoice,
     verify_claim,
 )
 
 load_dotenv()
 
-app = FastAPI()
+
+class OrjsonResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+app = FastAPI(default_response_class=OrjsonResponse)
+metrics.instrument_redis(redis)
 
 
 @app.on_event("startup")
 async def startup():
-    await initialize_lobbies()
+    await load_scripts()
+    lobby_cache.start()
+    # Background work runs in whichever worker process holds the leader lease
+    leader.start([initialize_lobbies, scheduler.run_scheduler, run_reaper])
+    if not DEV_MODE:
+        jwks_cache.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await leader.release()
+    await jwks_cache.close()
 
 
 # Serve frontend static files in production
@@ -46,6 +77,39 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+async def _active_lobby_count() -> float:
+    return await redis.scard(ACTIVE_LOBBIES_KEY)
+
+
+async def _redis_pool_in_use() -> float:
+    return pool_stats().get("in_use", 0)
+
+
+async def _tick_lag() -> float:
+    return scheduler.tick_lag
+
+
+async def _is_leader() -> float:
+    return 1 if leader.is_leader() else 0
+
+
+async def _token_cache_hits() -> float:
+    return token_cache.hits
+
+
+async def _token_cache_misses() -> float:
+    return token_cache.misses
+
+
+metrics.gauge("active_lobbies", "Lobbies in the active set", _active_lobby_count)
+metrics.gauge("redis_pool_connections_in_use", "Checked-out connections of this worker's Redis pool", _redis_pool_in_use)
+metrics.gauge("scheduler_tick_lag_seconds", "How late the most overdue job of the last scheduler pass ran", _tick_lag)
+metrics.gauge("leader", "1 if this worker holds the leader lease and runs background work", _is_leader)
+metrics.gauge("token_cache_hits_total", "Verified-token cache hits", _token_cache_hits, metric_type="counter")
+metrics.gauge("token_cache_misses_total", "Verified-token cache misses", _token_cache_misses, metric_type="counter")
 
 # --- Pydantic Models ---
 class JoinLobbyRequest(BaseModel):
@@ -71,18 +135,27 @@ async def health_check():
     return {
         "status": "healthy",
         "redis_connected": redis_connected,
+        "redis_pool": pool_stats(),
+        "leader": leader.is_leader(),
+        "scheduler_tick_lag_ms": round(scheduler.tick_lag * 1000, 1),
+        "token_cache": {"hits": token_cache.hits, "misses": token_cache.misses, "size": len(token_cache)},
         "timestamp": datetime.utcnow().isoformat()
     }
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(await metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/lobbies")
-async def get_lobbies(alien_id: str = Depends(verify_alien_token)):
-    lobbies = await list_lobbies()
+async def get_lobbies(alien_id: str = Depends(rate_limit.limit("lobbies"))):
+    lobbies = await lobby_cache.get()
     return {"lobbies": lobbies}
 
 
 @app.post("/api/game/join")
-async def join_lobby(request: JoinLobbyRequest, alien_id: str = Depends(verify_alien_token)):
+async def join_lobby(request: JoinLobbyRequest, alien_id: str = Depends(rate_limit.limit("join"))):
     try:
         result = await add_player_to_lobby(request.lobby_id, request.alien_id)
         return result
@@ -108,16 +181,140 @@ async def submit_grid(lobby_id: str, request: SubmitGridRequest, alien_id: str =
         raise HTTPException(status_code=400, detail=str(e))
 
 
+MAX_STATUS_WAIT = 30  # seconds a long poll may be held
+
+
+def _status_etag(version: int) -> str:
+    # Weak: time_elapsed keeps ticking between versions
+    return f'W/"{version}"'
+
+
+def _parse_status_etag(if_none_match: Optional[str]) -> Optional[int]:
+    if not if_none_match:
+        return None
+    try:
+        return int(if_none_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        return None
+
+
 @app.get("/api/game/{lobby_id}/status")
-async def get_game_status(lobby_id: str, alien_id: str = Depends(verify_alien_token)):
+async def get_game_status(lobby_id: str, request: Request, since: int = 0, view: str = "full", wait: float = 0,
+                          alien_id: str = Depends(rate_limit.limit("status"))):
+    """Full status, or only what changed after ``since``. 304 if the client's version is current.
+
+    ``view=player`` leaves out other players' grids. With ``wait`` (seconds, up to
+    MAX_STATUS_WAIT) and a known version, the request is a long poll: it is held
+    until the lobby changes, and answers 304 if the wait runs out first.
+    """
+    known_version = _parse_status_etag(request.headers.get("if-none-match"))
+    if known_version is None and since:
+        known_version = since
+    entry = None
     try:
-        return await lobby_get_game_status(lobby_id)
+        if wait > 0 and known_version is not None:
+            entry = await status_cache.wait_for_change(lobby_id, known_version, min(wait, MAX_STATUS_WAIT))
+        if since:
+            status = await lobby_get_game_status(lobby_id, since=since, known_version=known_version)
+            version = known_version if status is None else status["version"]
+        else:
+            if entry is None:
+                entry = await status_cache.get(lobby_id)
+            version = entry.version
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+    headers = {"ETag": _status_etag(version), "Cache-Control": "no-cache"}
+    if version == known_version:
+        return Response(status_code=304, headers=headers)
+    if since:
+        return OrjsonResponse(status, headers=headers)
+    body = entry.player_view(alien_id) if view == "player" else entry.body
+    return Response(entry.render(body), media_type="application/json", headers=headers)
+
+
+async def _snapshot_event(lobby_id: str, alien_id: str) -> Tuple[str, int]:
+    """The push channels' opening message: the player's view from the shared status cache, and its version."""
+    entry = await status_cache.get(lobby_id)
+    return (b'{"type":"snapshot","status":%s}' % entry.render(entry.player_view(alien_id))).decode(), entry.version
+
+
+def _in_snapshot(raw: str, version: int) -> bool:
+    """Whether a queued event is already reflected in a snapshot at ``version`` (resyncs carry none).
+
+    Events published between subscribing and taking the snapshot are in both.
+    Versions rise in publish order, so only those before the first newer event
+    need this check.
+    """
+    return orjson.loads(raw).get("version", version + 1) <= version
+
+
+# --- Push channel: number calls and lobby deltas ---
+# Browsers can't set headers on WebSocket/EventSource requests, so the token goes in the query string.
+
+SSE_KEEPALIVE_INTERVAL = 15
+
+
+@app.websocket("/api/game/{lobby_id}/ws")
+async def game_events_ws(websocket: WebSocket, lobby_id: str, token: str):
+    try:
+        alien_id = await authenticate_token(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    async with event_hub.listen(lobby_id) as queue:
+        # Subscribe before the snapshot so no delta falls in between
+        try:
+            snapshot, version = await _snapshot_event(lobby_id, alien_id)
+        except ValueError:
+            await websocket.close(code=4404)
+            return
+        await websocket.send_text(snapshot)
+
+        async def forward_events():
+            fresh = False
+            while True:
+                raw = await queue.get()
+                fresh = fresh or not _in_snapshot(raw, version)
+                if fresh:
+                    await websocket.send_text(raw)
+
+        forwarder = asyncio.create_task(forward_events())
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            forwarder.cancel()
+
+
+@app.get("/api/game/{lobby_id}/events")
+async def game_events_sse(lobby_id: str, request: Request, token: str):
+    alien_id = await authenticate_token(token)
+    if not await redis.exists(lobby_key(lobby_id)):
+        raise HTTPException(status_code=404, detail="Lobby not found")
+
+    async def stream():
+        async with event_hub.listen(lobby_id) as queue:
+            snapshot, version = await _snapshot_event(lobby_id, alien_id)
+            yield f"data: {snapshot}\n\n"
+            fresh = False
+            while not await request.is_disconnected():
+                try:
+                    raw = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                fresh = fresh or not _in_snapshot(raw, version)
+                if fresh:
+                    yield f"data: {raw}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 
 @app.post("/api/game/{lobby_id}/claim")
-async def claim_bingo(lobby_id: str, request: ClaimRequest, alien_id: str = Depends(verify_alien_token)):
+async def claim_bingo(lobby_id: str, request: ClaimRequest, alien_id: str = Depends(rate_limit.limit("claim"))):
     try:
         result = await verify_claim(lobby_id, request.alien_id, request.highlighted_numbers)
         if not result["valid"]:
@@ -129,22 +326,22 @@ async def claim_bingo(lobby_id: str, request: ClaimRequest, alien_id: str = Depe
 
 @app.post("/api/webhooks/payment")
 async def payment_webhook(request: Request):
-    body = await request.body()
-    payload = json.loads(body)
+    try:
+        payload = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
 
     invoice_id = payload.get("invoice")
     if not invoice_id:
         raise HTTPException(status_code=400, detail="Missing invoice ID")
 
-    invoice_data = await redis.hgetall(f"invoice:{invoice_id}")
-    if not invoice_data:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-
-    if payload.get("status") == "finalized":
-        lobby_id = invoice_data["lobby_id"]
-        amount = int(invoice_data["amount"])
-        await redis.hset(f"invoice:{invoice_id}", "status", "finalized")
-        await redis.hincrby(f"lobby:{lobby_id}", "pot", amount)
+    try:
+        if payload.get("status") == "finalized":
+            await settle_invoice(invoice_id)
+        else:
+            await check_invoice(invoice_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
     return {"success": True}
 
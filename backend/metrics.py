@@ -0,0 +1,201 @@
+"""In-process metrics with a Prometheus text exposition for GET /metrics.
+
+Recording is a dict lookup and a bisect, cheap enough to stay on under load:
+
+* ``http_request_duration_seconds``: per route template and method, via ``MetricsMiddleware``.
+* ``redis_commands_total`` / ``redis_command_duration_seconds``: every command and
+  pipeline issued through ``redis_client.redis`` (see ``instrument_redis``),
+  labelled with the lobby.py operation that issued it (see ``operation``).
+* Gauges registered with ``gauge()`` are evaluated at scrape time.
+
+Each worker process keeps its own values and a scrape reaches whichever worker
+accepts it, so every series carries a ``worker`` label (the process id): without
+it, successive scrapes of different workers would look like counter resets.
+Sum over ``worker`` to aggregate.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from bisect import bisect_left
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_current_operation: contextvars.ContextVar[str] = contextvars.ContextVar("redis_operation", default="other")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    pairs.append(f'worker="{os.getpid()}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+redis_commands = Counter(
+    "redis_commands_total", "Redis commands issued, by calling operation and command", ("operation", "command"))
+redis_duration = Histogram(
+    "redis_command_duration_seconds", "Redis round-trip latency by calling operation", ("operation",))
+
+_METRICS = [http_request_duration, redis_commands, redis_duration]
+_gauges: List[Tuple[str, str, str, Callable[[], Awaitable[float]]]] = []
+
+
+def gauge(name: str, help_text: str, read: Callable[[], Awaitable[float]], metric_type: str = "gauge") -> None:
+    """Register a value read when /metrics is scraped; ``metric_type="counter"`` for running totals kept elsewhere."""
+    _gauges.append((name, help_text, metric_type, read))
+
+
+def counter(name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+    """Create and register a counter."""
+    metric = Counter(name, help_text, label_names)
+    _METRICS.append(metric)
+    return metric
+
+
+async def render() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for name, help_text, metric_type, read in _gauges:
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name}{_format_labels((), ())} {await read()}"])
+    return "\n".join(lines) + "\n"
+
+
+# --- Redis instrumentation ---
+
+def operation(func):
+    """Attribute Redis commands issued while ``func`` runs to its name."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _current_operation.set(func.__name__)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _current_operation.reset(token)
+    return wrapper
+
+
+def _record_redis(command: str, count: int, elapsed: float) -> None:
+    op = _current_operation.get()
+    redis_commands.inc((op, command), count)
+    redis_duration.observe((op,), elapsed)
+
+
+def instrument_redis(client) -> None:
+    """Count and time every command and pipeline sent through ``client``."""
+    execute_command = client.execute_command
+    make_pipeline = client.pipeline
+
+    async def timed_execute_command(*args, **options):
+        start = time.perf_counter()
+        try:
+            return await execute_command(*args, **options)
+        finally:
+            _record_redis(str(args[0]).upper(), 1, time.perf_counter() - start)
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = make_pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def timed_execute(*exec_args, **exec_kwargs):
+            commands = len(pipe)
+            start = time.perf_counter()
+            try:
+                return await execute(*exec_args, **exec_kwargs)
+            finally:
+                _record_redis("PIPELINE", commands, time.perf_counter() - start)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = timed_pipeline
+
+
+# --- HTTP instrumentation ---
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_request_duration.observe((scope["method"], path, str(status[0])), time.perf_counter() - start)
+
+
+async def _task_count() -> float:
+    return len(asyncio.all_tasks())
+
+
+gauge("asyncio_tasks", "Live asyncio tasks in this worker (background loops, pollers, streams)", _task_count)
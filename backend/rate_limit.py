@@ -0,0 +1,133 @@
+"""Per-player, per-route rate limiting with a token bucket in Redis.
+
+Each (alien_id, route) pair has a bucket of ``burst`` tokens refilling at
+``rate`` per second, shared by every worker. One request takes one token; a
+check is a single TOKEN_BUCKET script call. An empty bucket answers 429 with
+Retry-After, and the worker remembers the refusal until then, so a client that
+keeps hammering is turned away in process without reaching Redis.
+
+If Redis is unreachable requests are let through: the limiter protects Redis
+and should not take the API down with it.
+
+RATE_LIMIT_ENABLED  "false" to turn limiting off, default "true"
+"""
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Tuple
+
+from fastapi import Depends, HTTPException
+
+import metrics
+from auth import verify_alien_token
+from scripts import register
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+REJECT_CACHE_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class Budget(NamedTuple):
+    burst: int  # bucket size: requests allowed back to back
+    rate: float  # tokens refilled per second: the sustained request rate
+
+
+# The frontend polls status every 1.5s and the lobby list every 3s
+BUDGETS: Dict[str, Budget] = {
+    "status": Budget(burst=20, rate=4),
+    "lobbies": Budget(burst=10, rate=1),
+    "join": Budget(burst=5, rate=0.2),
+    "claim": Budget(burst=5, rate=1),
+}
+
+rate_limited = metrics.counter("rate_limited_total", "Requests refused with 429, by route and where", ("route", "where"))
+
+# KEYS: bucket
+# ARGV: burst, rate (tokens/s)
+# Replies {1, 0} if a token was taken, else {0, ms until one is available}. Uses
+# the Redis clock so every worker sees one timeline. An idle bucket is full, so
+# it expires once it would have refilled.
+TOKEN_BUCKET = register("""
+local burst, rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = burst
+if state[1] then
+    tokens = math.min(burst, tonumber(state[1]) + (now - tonumber(state[2])) * rate / 1000)
+end
+if tokens < 1 then
+    return {0, math.ceil((1 - tokens) * 1000 / rate)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate))
+return {1, 0}
+""")
+
+
+class RejectCache:
+    """Bounded map of refused (route, alien_id) pairs to when they may retry (monotonic)."""
+
+    def __init__(self, max_size: int = REJECT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+    def retry_in(self, key: Tuple[str, str]) -> float:
+        """Seconds until ``key`` may retry; 0 if it is not being refused."""
+        until = self._entries.get(key)
+        if until is None:
+            return 0.0
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            del self._entries[key]
+            return 0.0
+        return remaining
+
+    def refuse(self, key: Tuple[str, str], seconds: float) -> None:
+        self._entries[key] = time.monotonic() + seconds
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+reject_cache = RejectCache()
+
+
+def _too_many_requests(seconds: float) -> HTTPException:
+    return HTTPException(status_code=429, detail="Too many requests",
+                         headers={"Retry-After": str(max(1, math.ceil(seconds)))})
+
+
+async def check(route: str, alien_id: str) -> None:
+    """Take a token from the player's bucket for ``route``; raises HTTPException 429 if empty."""
+    key = (route, alien_id)
+    retry_in = reject_cache.retry_in(key)
+    if retry_in:
+        rate_limited.inc((route, "local"))
+        raise _too_many_requests(retry_in)
+
+    budget = BUDGETS[route]
+    try:
+        allowed, retry_ms = await TOKEN_BUCKET(keys=[f"ratelimit:{route}:{alien_id}"], args=[budget.burst, budget.rate])
+    except Exception:
+        logger.exception("Rate limit check failed; letting the request through")
+        return
+    if not allowed:
+        reject_cache.refuse(key, retry_ms / 1000)
+        rate_limited.inc((route, "redis"))
+        raise _too_many_requests(retry_ms / 1000)
+
+
+def limit(route: str):
+    """Dependency authenticating the player and charging one request to their ``route`` budget."""
+    if route not in BUDGETS:
+        raise KeyError(f"No rate limit budget for route {route!r}")
+
+    async def dependency(alien_id: str = Depends(verify_alien_token)) -> str:
+        if RATE_LIMIT_ENABLED:
+            await check(route, alien_id)
+        return alien_id
+    return dependency
@@ -0,0 +1,166 @@
+"""Background cleanup of finished and expired lobbies.
+
+Request paths never write during reads; ids of lobbies that finished or whose
+hash expired are dropped from the active set here instead. Every per-lobby key
+expires together with the lobby hash (see ``expire_lobby`` in scripts.py), so
+the only state left behind by an expired lobby is its id in the active and
+empty lobby sets and its reserved name.
+
+Expired lobbies are reaped as Redis reports them: the reaper pattern-subscribes
+to the keyspace channels of lobby keys only (``notify-keyspace-events Kx``,
+enabled at startup when CONFIG is allowed), so other keys expiring do not reach
+it. A periodic sweep backs them up, since pub/sub
+drops events while a worker is disconnected and Redis may expire a key well
+after its TTL. The sweep also re-arms scheduler jobs for live games that lost
+theirs (a worker died between a state transition and scheduling its
+follow-up), and repairs the empty lobby set if a worker died between a join or
+leave and updating it.
+
+REAPER_KEYSPACE_EVENTS  "false" to reap by sweep only, default "true"
+REAPER_INTERVAL         sweep seconds without expiry notifications, default 10
+REAPER_SWEEP_INTERVAL   fallback sweep seconds with them, default 60
+"""
+import asyncio
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from redis.exceptions import RedisError
+
+import events
+import scheduler
+from events import RESYNC_EVENT, event_hub
+from lobby import ACTIVE_LOBBIES_KEY, EMPTY_LOBBIES_KEY, ensure_empty_lobby_exists, release_lobby_names
+from redis_client import REDIS_CLUSTER, lobby_key, redis
+
+REAPER_KEYSPACE_EVENTS = os.getenv("REAPER_KEYSPACE_EVENTS", "true").lower() == "true"
+REAPER_INTERVAL = int(os.getenv("REAPER_INTERVAL", "10"))
+REAPER_SWEEP_INTERVAL = int(os.getenv("REAPER_SWEEP_INTERVAL", "60"))
+
+# Keyspace channel of a lobby hash, not one of its sub-keys: lobby:<id> or lobby:{<id>}
+_LOBBY_HASH_CHANNEL = re.compile(r"^__keyspace@\d+__:lobby:\{?([^:{}]+)\}?$")
+
+logger = logging.getLogger(__name__)
+
+
+async def reap_lobbies() -> int:
+    """Sweep the active lobby set for stale ids. Returns how many were reaped."""
+    # Read before the active set, so a lobby created in between is not mistaken for a stale entry
+    indexed_empty = await redis.smembers(EMPTY_LOBBIES_KEY)
+    active_ids = list(await redis.smembers(ACTIVE_LOBBIES_KEY))
+    async with redis.pipeline(transaction=False) as pipe:
+        for lid in active_ids:
+            pipe.hmget(lobby_key(lid), "status", "forming_deadline", "player_count")
+            pipe.zscore(scheduler.DUE_KEY, f"forming:{lid}")
+            pipe.zscore(scheduler.DUE_KEY, f"call:{lid}")
+        results = await pipe.execute()
+
+    stale = []
+    empty = set()
+    for i, lid in enumerate(active_ids):
+        (status, deadline, player_count), forming_due, call_due = results[3 * i:3 * i + 3]
+        if not status or status == "finished":
+            stale.append(lid)
+        elif status == "forming" and int(player_count or 0) == 0:
+            empty.add(lid)
+        elif status == "active" and call_due is None:
+            await scheduler.schedule("call", lid, 0)
+        elif status == "forming" and deadline and int(player_count or 0) > 0 and forming_due is None:
+            due_at = datetime.fromisoformat(deadline).replace(tzinfo=timezone.utc).timestamp()
+            await scheduler.schedule("forming", lid, due_at)
+
+    unindexed, misindexed = empty - indexed_empty, indexed_empty - empty
+    if unindexed or misindexed:
+        async with redis.pipeline(transaction=False) as pipe:
+            if unindexed:
+                pipe.sadd(EMPTY_LOBBIES_KEY, *unindexed)
+            if misindexed:
+                pipe.srem(EMPTY_LOBBIES_KEY, *misindexed)
+            await pipe.execute()
+    await _remove_lobbies(stale)
+    # A reaped lobby may have been an empty one, or a worker died between taking
+    # a lobby out of the pool on join and replacing it; one SCARD when all is well
+    await ensure_empty_lobby_exists()
+    return len(stale)
+
+
+async def reap_expired(lobby_ids: List[str]) -> None:
+    """Remove lobbies whose hash expired, as reported by keyspace notifications."""
+    if not lobby_ids:
+        return
+    await _remove_lobbies(lobby_ids)
+    await ensure_empty_lobby_exists()
+
+
+async def _remove_lobbies(lobby_ids: List[str]) -> None:
+    if not lobby_ids:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.srem(ACTIVE_LOBBIES_KEY, *lobby_ids)
+        pipe.srem(EMPTY_LOBBIES_KEY, *lobby_ids)
+        for lid in lobby_ids:
+            events.announce_lobby_change(pipe, lid)
+        await pipe.execute()
+    await release_lobby_names(lobby_ids)
+
+
+async def enable_expiry_events() -> Optional[str]:
+    """Pattern of the keyspace channels reporting lobby key expiries, turning the notifications on if needed.
+
+    With hash tags the pattern matches lobby hashes only; otherwise it also
+    matches their sub-keys, which the reaper skips.
+
+    Returns None when they are disabled or unavailable: in cluster mode every
+    node publishes its own, and managed Redis often refuses CONFIG.
+    """
+    if not REAPER_KEYSPACE_EVENTS or REDIS_CLUSTER:
+        return None
+    try:
+        flags = (await redis.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+        if "K" not in flags or not ("x" in flags or "A" in flags):
+            await redis.config_set("notify-keyspace-events", flags + "Kx")
+    except RedisError:
+        logger.warning("Cannot enable keyspace expiry notifications; reaping by sweep only")
+        return None
+    db = redis.connection_pool.connection_kwargs.get("db", 0)
+    return f"__keyspace@{db}__:{lobby_key('*')}"
+
+
+async def _sweep_forever(interval: int) -> None:
+    while True:
+        try:
+            await reap_lobbies()
+        except Exception:
+            logger.exception("Lobby reaper pass failed")
+        await asyncio.sleep(interval)
+
+
+async def run_reaper() -> None:
+    """Reap expired lobbies as they expire, sweeping periodically as a fallback, forever."""
+    pattern = await enable_expiry_events()
+    if pattern is None:
+        await _sweep_forever(REAPER_INTERVAL)
+        return
+
+    sweeper = asyncio.create_task(_sweep_forever(REAPER_SWEEP_INTERVAL))
+    try:
+        async with event_hub.listen_pattern(pattern) as queue:
+            while True:
+                # Drain whatever arrived together; the queue itself is bounded by the event hub
+                notices = [await queue.get()]
+                while not queue.empty():
+                    notices.append(queue.get_nowait())
+                try:
+                    if RESYNC_EVENT in notices:
+                        # Fell behind and lost events: sweep instead
+                        await reap_lobbies()
+                        continue
+                    # Other keyspace events arrive too if the server has more classes enabled
+                    matches = (_LOBBY_HASH_CHANNEL.match(channel) for channel, event in notices if event == "expired")
+                    await reap_expired([match.group(1) for match in matches if match])
+                except Exception:
+                    logger.exception("Reaping expired lobbies failed")
+    finally:
+        sweeper.cancel()
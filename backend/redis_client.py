@@ -1,11 +1,118 @@
+"""Shared Redis client, configured from the environment.
+
+REDIS_URL                    redis://localhost:6379 (with REDIS_CLUSTER, any node)
+REDIS_MAX_CONNECTIONS        connections per worker (per node in cluster mode), default 50
+REDIS_POOL_TIMEOUT           seconds a command waits for a free connection, default 5
+REDIS_SOCKET_TIMEOUT         seconds, default 5
+REDIS_CONNECT_TIMEOUT        seconds, default 2
+REDIS_HEALTH_CHECK_INTERVAL  PING a connection idle this many seconds before reuse, default 30
+REDIS_RETRIES                retries with exponential backoff on connection errors, default 3
+                             (never for script calls, see ``no_retry``)
+REDIS_CLUSTER                "true" to use Redis Cluster; implies REDIS_HASH_TAGS
+REDIS_HASH_TAGS              "true" to key lobbies as ``lobby:{<lobby_id>}`` so every key
+                             of a lobby hashes to one cluster slot
+
+Script calls are not retried at all: a connection can drop after a transition
+script ran but before its reply arrived, and replaying it is not safe (a number
+called twice, a winner told the game is over). Try cluster mode locally with three redis-server
+processes started with ``--cluster-enabled yes`` on ports 7000-7002, joined by
+``redis-cli --cluster create 127.0.0.1:7000 127.0.0.1:7001 127.0.0.1:7002``, then
+REDIS_CLUSTER=true REDIS_URL=redis://127.0.0.1:7000.
+"""
 import redis.asyncio as aioredis
+import contextvars
 import os
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from redis.asyncio.cluster import RedisCluster
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff, NoBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError
 
 load_dotenv()
 
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-redis = aioredis.from_url(redis_url, decode_responses=True)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", "3"))
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() == "true"
+REDIS_HASH_TAGS = REDIS_CLUSTER or os.getenv("REDIS_HASH_TAGS", "false").lower() == "true"
+
+
+# True while a call that must not be replayed is in flight
+_no_retry = contextvars.ContextVar("no_retry", default=False)
+
+
+@contextmanager
+def no_retry():
+    """Send the commands issued inside the block at most once, even if the connection drops."""
+    token = _no_retry.set(True)
+    try:
+        yield
+    finally:
+        _no_retry.reset(token)
+
+
+class _Retry(Retry):
+    """Retry policy that stands down inside ``no_retry()``.
+
+    The standalone client retries through call_with_retry(); the cluster client
+    runs its own loop bounded by get_retries().
+    """
+
+    def get_retries(self) -> int:
+        return 0 if _no_retry.get() else super().get_retries()
+
+    async def call_with_retry(self, do, fail, *args, **kwargs):
+        if _no_retry.get():
+            once = Retry(NoBackoff(), 0, supported_errors=self._supported_errors)
+            return await once.call_with_retry(do, fail, *args, **kwargs)
+        return await super().call_with_retry(do, fail, *args, **kwargs)
+
+
+def _retry() -> Retry:
+    return _Retry(ExponentialBackoff(cap=1.0, base=0.05), REDIS_RETRIES, supported_errors=(RedisConnectionError,))
+
+
+def create_client():
+    options = dict(
+        decode_responses=True,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry=_retry(),
+    )
+    if REDIS_CLUSTER:
+        return RedisCluster.from_url(redis_url, **options)
+    # Blocking pool: a burst beyond max_connections queues for REDIS_POOL_TIMEOUT instead of failing
+    pool = aioredis.BlockingConnectionPool.from_url(redis_url, timeout=REDIS_POOL_TIMEOUT, **options)
+    return aioredis.Redis(connection_pool=pool)
+
+
+redis = create_client()
+
+
+def lobby_key(lobby_id: str, *parts: str) -> str:
+    """Key of a lobby hash, or of one of its sub-keys (``lobby_key(lid, "player", aid)``).
+
+    The Lua scripts derive sub-keys by appending ``:<part>`` to the lobby key,
+    so they land on the same cluster slot as well.
+    """
+    base = f"lobby:{{{lobby_id}}}" if REDIS_HASH_TAGS else f"lobby:{lobby_id}"
+    return ":".join((base, *parts)) if parts else base
+
+
+def pool_stats() -> dict:
+    """Connections in use and idle in this worker's pool (standalone mode only)."""
+    pool = getattr(redis, "connection_pool", None)
+    if pool is None:
+        return {}
+    return {"in_use": len(pool._in_use_connections), "idle": len(pool._available_connections)}
+
 
 async def check_redis_connection():
     try:
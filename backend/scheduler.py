@@ -0,0 +1,169 @@
+"""Durable, crash-resumable job scheduler backed by a Redis sorted set.
+
+Jobs are ``"<kind>:<lobby_id>"`` members of ``scheduler:due`` scored by the unix
+time they are due. The leader worker (see leader.py) runs the ``run_scheduler``
+loop, which claims due jobs under a lease (their score is pushed LEASE_SECONDS
+into the future) and dispatches them to the handler registered for their kind.
+A handler returns the next due time to reschedule the job, or None when it is
+done. If the worker dies mid-job the lease runs out and the next leader picks
+the job up again; the leases also keep two loops safe should they ever overlap.
+
+Kinds with a batch handler get every due lobby of a pass in one call, so a pass
+costs a fixed number of round trips (claim, batch, complete) however many
+lobbies are due. ``tick_lag`` is how late the most overdue job of the last pass
+was picked up; a growing value means the loop is falling behind.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from redis.exceptions import NoScriptError
+
+from redis_client import no_retry, redis
+from scripts import load_scripts, queue_script, register
+
+DUE_KEY = "scheduler:due"
+POLL_INTERVAL = 0.1  # seconds
+LEASE_SECONDS = 10
+CLAIM_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], Awaitable[Optional[float]]]
+BatchHandler = Callable[[List[str]], Awaitable[List[Optional[float]]]]
+_handlers: Dict[str, Handler] = {}
+_batch_handlers: Dict[str, BatchHandler] = {}
+
+tick_lag = 0.0  # seconds
+
+# KEYS: due zset
+# ARGV: now, lease_until, limit
+# Replies [job, due, job, due, ...] with the original due times.
+_CLAIM_DUE = register("""
+local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[3])
+for i = 1, #jobs, 2 do
+    redis.call('ZADD', KEYS[1], ARGV[2], jobs[i])
+end
+return jobs
+""")
+
+# KEYS: due zset
+# ARGV: job, lease_until, next_due ('' to remove)
+# Only touches the job if it still carries our lease, so a job rescheduled by
+# someone else meanwhile (or re-claimed after our lease ran out) is left alone.
+_COMPLETE = register("""
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) ~= tonumber(ARGV[2]) then
+    return 0
+end
+if ARGV[3] == '' then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+else
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+end
+return 1
+""")
+
+
+def register_handler(kind: str, handler: Handler) -> None:
+    """Route due jobs of ``kind`` to ``handler(lobby_id)``."""
+    _handlers[kind] = handler
+
+
+def register_batch_handler(kind: str, handler: BatchHandler) -> None:
+    """Route all due jobs of ``kind`` in a pass to ``handler(lobby_ids)``.
+
+    It returns one next-due per id, or the exception a single job failed with.
+    """
+    _batch_handlers[kind] = handler
+
+
+async def schedule(kind: str, lobby_id: str, due_at: float) -> None:
+    """Schedule (or reschedule) a job for ``due_at`` (unix time)."""
+    await redis.zadd(DUE_KEY, {f"{kind}:{lobby_id}": due_at})
+
+
+async def cancel(kind: str, lobby_id: str) -> None:
+    await redis.zrem(DUE_KEY, f"{kind}:{lobby_id}")
+
+
+async def _claim_due_jobs(now: float, lease_until: float) -> List[Tuple[str, float]]:
+    flat = await _CLAIM_DUE(keys=[DUE_KEY], args=[now, lease_until, CLAIM_BATCH_SIZE])
+    return [(flat[i], float(flat[i + 1])) for i in range(0, len(flat), 2)]
+
+
+async def _run_single(kind: str, lobby_id: str) -> Optional[float]:
+    handler = _handlers.get(kind)
+    if handler is None:
+        raise LookupError(f"No scheduler handler for job kind {kind!r}")
+    return await handler(lobby_id)
+
+
+async def _run_kind(kind: str, lobby_ids: List[str]) -> List:
+    """Run every due job of one kind; failed jobs come back as exceptions."""
+    batch_handler = _batch_handlers.get(kind)
+    if batch_handler is not None:
+        try:
+            return await batch_handler(lobby_ids)
+        except Exception as e:
+            return [e] * len(lobby_ids)
+    return await asyncio.gather(*(_run_single(kind, lid) for lid in lobby_ids), return_exceptions=True)
+
+
+async def _complete_jobs(completed: List[Tuple[str, Optional[float]]], lease_until: float) -> None:
+    async def complete():
+        async with redis.pipeline(transaction=False) as pipe:
+            for job, next_due in completed:
+                queue_script(pipe, _COMPLETE, keys=[DUE_KEY],
+                             args=[job, lease_until, "" if next_due is None else next_due])
+            with no_retry():
+                await pipe.execute()
+    try:
+        await complete()
+    except NoScriptError:
+        await load_scripts()
+        await complete()
+
+
+async def run_pass() -> int:
+    """Claim due jobs, run them grouped by kind and complete them. Returns jobs claimed."""
+    global tick_lag
+    now = time.time()
+    lease_until = now + LEASE_SECONDS
+    claimed = await _claim_due_jobs(now, lease_until)
+    tick_lag = max((now - due for _, due in claimed), default=0.0)
+    if not claimed:
+        return 0
+
+    by_kind: Dict[str, List[str]] = defaultdict(list)
+    for job, _ in claimed:
+        kind, lobby_id = job.split(":", 1)
+        by_kind[kind].append(lobby_id)
+    kinds = list(by_kind)
+    results = await asyncio.gather(*(_run_kind(kind, by_kind[kind]) for kind in kinds))
+
+    completed = []
+    for kind, next_dues in zip(kinds, results):
+        for lobby_id, next_due in zip(by_kind[kind], next_dues):
+            if isinstance(next_due, Exception):
+                # Left under lease; another pass retries it once the lease runs out
+                logger.error("Scheduled job %s:%s failed: %r", kind, lobby_id, next_due)
+                continue
+            completed.append((f"{kind}:{lobby_id}", next_due))
+    if completed:
+        await _complete_jobs(completed, lease_until)
+    return len(claimed)
+
+
+async def run_scheduler() -> None:
+    """Claim and run due jobs forever. One loop drives every lobby."""
+    while True:
+        claimed = 0
+        try:
+            claimed = await run_pass()
+        except Exception:
+            logger.exception("Scheduler pass failed")
+        if claimed < CLAIM_BATCH_SIZE:
+            await asyncio.sleep(POLL_INTERVAL)
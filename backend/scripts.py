@@ -0,0 +1,695 @@
+"""Server-side Lua scripts for atomic lobby reads and state transitions.
+
+Transition scripts validate and mutate a lobby in one round trip and reply with
+``[payload_json, action]``. ``payload_json`` is the API response (or
+``{"error": ...}``) and ``action`` names the in-process follow-up the caller
+must run: ``"start_timer"``, ``"cancel_timer"``, ``"start_game"``, ``"finish"``
+or ``""``.
+"""
+import json
+import os
+from typing import List, Tuple
+
+from redis.commands.core import AsyncScript
+
+from redis_client import no_retry, redis
+
+# Pot ledgers and invoice dedup sets outlive their lobby so payments can be audited and replayed
+LEDGER_TTL = int(os.getenv("LEDGER_TTL", str(30 * 24 * 3600)))
+
+_SCRIPTS = []
+
+
+class Script(AsyncScript):
+    """A script whose calls are never retried: it may have run before its connection dropped."""
+
+    async def __call__(self, keys=None, args=None, client=None):
+        with no_retry():
+            return await super().__call__(keys, args, client)
+
+
+def register(source: str) -> Script:
+    """Register a Lua script to be preloaded into the script cache by load_scripts()."""
+    script = Script(redis, source)
+    _SCRIPTS.append(script)
+    return script
+
+# Shared Lua helpers, prepended to the scripts that need them.
+_HELPERS = "local LEDGER_TTL = %d\n" % LEDGER_TTL + """
+-- Winning lines in lobby.WIN_LINES order
+local LINE_NAMES = {'row_0', 'row_1', 'row_2', 'col_0', 'col_1', 'col_2', 'diagonal_main', 'diagonal_anti'}
+
+local function reply(payload, action)
+    return {cjson.encode(payload), action or ''}
+end
+
+local function fail(message)
+    return reply({error = message}, '')
+end
+
+-- Number masks: number n is bit n-1. Written with arithmetic rather than the bit
+-- library, which not every Redis-compatible server ships; Lua numbers are doubles,
+-- so masks stay exact well past lobby.MAX_NUMBER.
+local function with_number(mask, n)
+    if math.floor(mask / 2 ^ (n - 1)) % 2 == 1 then
+        return mask
+    end
+    return mask + 2 ^ (n - 1)
+end
+
+-- Whether every number in sub is also in mask
+local function covers(mask, sub)
+    while sub > 0 do
+        if sub % 2 == 1 and mask % 2 == 0 then
+            return false
+        end
+        sub, mask = math.floor(sub / 2), math.floor(mask / 2)
+    end
+    return true
+end
+
+-- Every mutation goes through emit(): it bumps the lobby state version, stamps
+-- it on the event and publishes on the events.lobby_channel() channel.
+local function emit(lobby, event)
+    event.version = redis.call('HINCRBY', lobby, 'version', 1)
+    redis.call('PUBLISH', lobby .. ':events', cjson.encode(event))
+    return event.version
+end
+
+-- Notifies lobby-list caches (events.LOBBIES_CHANNEL) that a lobby summary changed
+local function announce(lobby)
+    redis.call('PUBLISH', 'lobbies:events', redis.call('HGET', lobby, 'lobby_id'))
+end
+
+-- Appends a pot movement to the lobby's ledger stream (lobby:{id}:ledger), read back
+-- by lobby.replay_ledger(). kind is 'buy_in', 'refund', 'payment' or 'payout'; amounts
+-- are positive and the kind gives the direction.
+local function record(lobby, kind, alien_id, amount, ref)
+    local ledger = lobby .. ':ledger'
+    redis.call('XADD', ledger, '*', 'type', kind, 'alien_id', alien_id, 'amount', amount, 'ref', ref or '')
+    redis.call('EXPIRE', ledger, LEDGER_TTL)
+end
+
+-- Every per-lobby key expires together with the lobby hash. Transitions that
+-- extend a lobby's life (join, start) pass LOBBY_TTL; a missing key is skipped.
+local LOBBY_SUB_KEYS = {':players', ':numbers_called', ':called_versions', ':draw_order', ':daub'}
+
+local function expire_lobby(lobby, ttl)
+    redis.call('EXPIRE', lobby, ttl)
+    for _, suffix in ipairs(LOBBY_SUB_KEYS) do
+        redis.call('EXPIRE', lobby .. suffix, ttl)
+    end
+    for _, aid in ipairs(redis.call('SMEMBERS', lobby .. ':players')) do
+        redis.call('EXPIRE', lobby .. ':player:' .. aid, ttl)
+    end
+end
+
+-- Auto-daub lobbies: index the (line, player) pairs each number advances in
+-- lobby:{id}:daub, as field "n:<number>" -> newline-separated "<line>|<alien_id>".
+-- CALL_NUMBER keeps each pair's hit count in the same hash under that entry;
+-- the order of the entries does not decide a winner.
+local function index_daub_lines(lobby)
+    local daub = lobby .. ':daub'
+    redis.call('DEL', daub)
+    local entries = {}
+    for _, aid in ipairs(redis.call('SMEMBERS', lobby .. ':players')) do
+        local state = redis.call('HMGET', lobby .. ':player:' .. aid, 'active', 'line_masks')
+        if state[1] == 'true' and state[2] then
+            local line = 0
+            for mask in string.gmatch(state[2], '%d+') do
+                line = line + 1
+                local m, n = tonumber(mask), 1
+                while m > 0 do
+                    if m % 2 == 1 then
+                        local field = 'n:' .. n
+                        entries[field] = (entries[field] and entries[field] .. '\\n' or '') .. line .. '|' .. aid
+                    end
+                    m = math.floor(m / 2)
+                    n = n + 1
+                end
+            end
+        end
+    end
+    for field, value in pairs(entries) do
+        redis.call('HSET', daub, field, value)
+    end
+end
+
+-- Persists the draw order (comma-separated) so any worker can resume the game
+local function start_game(lobby, draw_order_key, draw_order, started_at, ttl)
+    if redis.call('HGET', lobby, 'status') ~= 'forming' then
+        return false
+    end
+    redis.call('HSET', lobby, 'status', 'active', 'started_at', started_at, 'called_mask', 0)
+    redis.call('DEL', draw_order_key)
+    for n in string.gmatch(draw_order, '%d+') do
+        redis.call('RPUSH', draw_order_key, n)
+    end
+    if redis.call('HGET', lobby, 'daub_mode') == 'auto' then
+        index_daub_lines(lobby)
+    end
+    expire_lobby(lobby, ttl)
+    emit(lobby, {type = 'game_started', started_at = started_at})
+    announce(lobby)
+    return true
+end
+
+local function finish_game(lobby, winner, finished_at)
+    local status = redis.call('HGET', lobby, 'status')
+    if not status or status == 'finished' then
+        return false
+    end
+    redis.call('HSET', lobby, 'status', 'finished', 'winner', winner, 'finished_at', finished_at)
+    if winner ~= '' then
+        record(lobby, 'payout', winner, redis.call('HGET', lobby, 'pot') or '0')
+    end
+    emit(lobby, {type = 'game_finished', winner = winner ~= '' and winner or cjson.null})
+    announce(lobby)
+    return true
+end
+"""
+
+# Called numbers are a codec.FORMAT_V1 string, one character per number in call
+# order. Games started before the codec kept a list of decimal strings under the
+# same key; called_sequence() reads either and, with migrate, rewrites the list.
+_CODEC = """
+local CODEC_V1 = 'A'
+
+local function called_sequence(key, migrate)
+    if redis.call('TYPE', key).ok ~= 'list' then
+        return redis.call('GET', key) or ''
+    end
+    local chars = {CODEC_V1}
+    for _, n in ipairs(redis.call('LRANGE', key, 0, -1)) do
+        chars[#chars + 1] = string.char(tonumber(n))
+    end
+    local sequence = table.concat(chars)
+    if migrate then
+        redis.call('DEL', key)
+        redis.call('SET', key, sequence)
+    end
+    return sequence
+end
+"""
+
+# Fetches the lobby status in a single round trip.
+# KEYS: lobby, players set, numbers_called, called_versions
+# ARGV: player key prefix, since, known_version
+# Replies {} if the lobby is missing and {version} if it is still at known_version.
+# Otherwise replies {lobby, players, called (codec string), player_ids}; with since > 0
+# only players and called numbers changed after version `since` are included.
+STATUS_SNAPSHOT = register(_CODEC + """
+local version = redis.call('HGET', KEYS[1], 'version')
+if not version then
+    return {}
+end
+if version == ARGV[3] then
+    return {version}
+end
+local since = tonumber(ARGV[2])
+if since > tonumber(version) then
+    since = 0  -- Client version is from the future (e.g. a recreated lobby): send everything
+end
+local lobby = redis.call('HGETALL', KEYS[1])
+local player_ids = redis.call('SMEMBERS', KEYS[2])
+local players = {}
+for _, aid in ipairs(player_ids) do
+    local key = ARGV[1] .. aid
+    if since == 0 or tonumber(redis.call('HGET', key, 'version') or '0') > since then
+        local player = redis.call('HGETALL', key)
+        if #player > 0 then
+            players[#players + 1] = player
+        end
+    end
+end
+local called = called_sequence(KEYS[3], false)
+if since > 0 and called ~= '' then
+    -- Versions rise with each call, so the new numbers are a suffix
+    local called_versions = redis.call('LRANGE', KEYS[4], 0, -1)
+    local first_new = #called_versions + 1
+    for i, v in ipairs(called_versions) do
+        if tonumber(v) > since then
+            first_new = i
+            break
+        end
+    end
+    called = CODEC_V1 .. string.sub(called, first_new + 1)
+end
+return {lobby, players, called, player_ids}
+""")
+
+# KEYS: lobby, players set, player
+# ARGV: alien_id, max_players, buy_in, ttl, joined_at, forming_deadline
+JOIN_LOBBY = register(_HELPERS + """
+local lobby, players, player = KEYS[1], KEYS[2], KEYS[3]
+local status = redis.call('HGET', lobby, 'status')
+if not status then
+    return fail('Lobby not found')
+end
+if status ~= 'forming' then
+    return fail('Lobby is no longer accepting players')
+end
+
+local lobby_id = redis.call('HGET', lobby, 'lobby_id')
+local player_count = tonumber(redis.call('HGET', lobby, 'player_count') or '0')
+if redis.call('SISMEMBER', players, ARGV[1]) == 1 then
+    return reply({
+        lobby_id = lobby_id,
+        status = status,
+        player_count = player_count,
+        pot = tonumber(redis.call('HGET', lobby, 'pot')),
+    })
+end
+if player_count >= tonumber(ARGV[2]) then
+    return fail('Lobby is full')
+end
+
+redis.call('HSET', player, 'alien_id', ARGV[1], 'grid', '',
+    'ready', 'false', 'active', 'true', 'joined_at', ARGV[5])
+redis.call('SADD', players, ARGV[1])
+expire_lobby(lobby, ARGV[4])
+player_count = redis.call('HINCRBY', lobby, 'player_count', 1)
+redis.call('HINCRBY', lobby, 'active_count', 1)
+local pot = redis.call('HINCRBY', lobby, 'pot', ARGV[3])
+record(lobby, 'buy_in', ARGV[1], ARGV[3])
+
+local action = ''
+if (redis.call('HGET', lobby, 'forming_deadline') or '') == '' then
+    redis.call('HSET', lobby, 'forming_deadline', ARGV[6])
+    action = 'start_timer'
+end
+local version = emit(lobby, {type = 'player_joined', alien_id = ARGV[1], player_count = player_count, pot = pot})
+redis.call('HSET', player, 'version', version)
+announce(lobby)
+return reply({lobby_id = lobby_id, status = status, player_count = player_count, pot = pot}, action)
+""")
+
+# KEYS: lobby, players set, player
+# ARGV: alien_id, buy_in
+LEAVE_LOBBY = register(_HELPERS + """
+local lobby, players, player = KEYS[1], KEYS[2], KEYS[3]
+local status = redis.call('HGET', lobby, 'status')
+if not status then
+    return fail('Lobby not found')
+end
+if status ~= 'forming' then
+    return fail('Cannot leave a game in progress')
+end
+local state = redis.call('HMGET', player, 'ready', 'active')
+if redis.call('EXISTS', player) == 0 then
+    return fail('Player not in this lobby')
+end
+
+redis.call('DEL', player)
+redis.call('SREM', players, ARGV[1])
+local player_count = redis.call('HINCRBY', lobby, 'player_count', -1)
+if state[2] == 'true' then
+    redis.call('HINCRBY', lobby, 'active_count', -1)
+    if state[1] == 'true' then
+        redis.call('HINCRBY', lobby, 'ready_count', -1)
+    end
+end
+local pot = redis.call('HINCRBY', lobby, 'pot', -tonumber(ARGV[2]))
+record(lobby, 'refund', ARGV[1], ARGV[2])
+local action = ''
+if player_count == 0 then
+    -- Reset forming deadline since no players left
+    redis.call('HSET', lobby, 'forming_deadline', '')
+    action = 'cancel_timer'
+end
+emit(lobby, {type = 'player_left', alien_id = ARGV[1], player_count = player_count, pot = pot})
+announce(lobby)
+return reply({success = true}, action)
+""")
+
+# KEYS: lobby, player, draw_order
+# ARGV: grid (codec), min_players, started_at, ttl, auto, alien_id, draw_order, line_masks
+# With auto = '1' (forming timer auto-submit) a player who is already ready keeps their grid.
+SUBMIT_GRID = register(_HELPERS + """
+local lobby, player = KEYS[1], KEYS[2]
+local status = redis.call('HGET', lobby, 'status')
+if not status then
+    return fail('Lobby not found')
+end
+if status ~= 'forming' then
+    return fail('Cannot submit grid in current game state')
+end
+local state = redis.call('HMGET', player, 'ready', 'active')
+if redis.call('EXISTS', player) == 0 then
+    return fail('Player not in this lobby')
+end
+
+local ready_count = tonumber(redis.call('HGET', lobby, 'ready_count') or '0')
+if ARGV[5] == '1' and state[1] == 'true' then
+    return reply({success = true, ready_count = ready_count})
+end
+if state[1] ~= 'true' and state[2] == 'true' then
+    ready_count = redis.call('HINCRBY', lobby, 'ready_count', 1)
+end
+local version = emit(lobby, {type = 'player_ready', alien_id = ARGV[6], ready_count = ready_count})
+redis.call('HSET', player, 'grid', ARGV[1], 'line_masks', ARGV[8],
+    'ready', 'true', 'version', version)
+
+-- Start the game immediately once every active player is ready
+local action = ''
+local counts = redis.call('HMGET', lobby, 'player_count', 'active_count')
+if tonumber(counts[1] or '0') >= tonumber(ARGV[2]) and ready_count >= tonumber(counts[2] or '0') then
+    if start_game(lobby, KEYS[3], ARGV[7], ARGV[3], ARGV[4]) then
+        action = 'start_game'
+    end
+end
+return reply({
+    success = true,
+    ready_count = ready_count,
+    message = 'Grid submitted. Waiting for other players.',
+}, action)
+""")
+
+# KEYS: lobby, draw_order
+# ARGV: draw_order, started_at, ttl
+START_GAME = register(_HELPERS + """
+if start_game(KEYS[1], KEYS[2], ARGV[1], ARGV[2], ARGV[3]) then
+    return reply({started = true}, 'start_game')
+end
+return reply({started = false})
+""")
+
+# KEYS: lobby, numbers_called, called_versions, draw_order, daub
+# ARGV: finished_at
+# Calls the next number of the persisted draw order, sets its bit in the lobby's
+# running called_mask and replies with it. In auto-daub lobbies it also advances
+# the hit counter of every line holding the number and settles the game as soon
+# as an active player's line reaches 3. If one call completes lines for several
+# players, the earliest joiner wins (ties by alien_id), with their first line
+# in LINE_NAMES order as the pattern.
+# Replies 0 if the game is no longer active, -1 once the draw order is exhausted
+# and -2 if the call completed a line and finished the game.
+CALL_NUMBER = register(_HELPERS + _CODEC + """
+local lobby = KEYS[1]
+if redis.call('HGET', lobby, 'status') ~= 'active' then
+    return 0
+end
+local sequence = called_sequence(KEYS[2], true)
+local number = redis.call('LINDEX', KEYS[4], math.max(#sequence - 1, 0))
+if not number then
+    return -1
+end
+local called = redis.call('HMGET', lobby, 'latest_number', 'called_mask', 'daub_mode')
+local previous = called[1]
+local called_mask = with_number(tonumber(called[2] or '0'), tonumber(number))
+local version = emit(lobby, {
+    type = 'number_called',
+    number = tonumber(number),
+    previous_number = previous and tonumber(previous) or cjson.null,
+})
+redis.call('APPEND', KEYS[2], (sequence == '' and CODEC_V1 or '') .. string.char(tonumber(number)))
+redis.call('RPUSH', KEYS[3], version)
+if redis.call('TTL', KEYS[2]) == -1 then
+    -- Created (or migrated) by this call: give both keys the lobby hash's remaining TTL
+    local ttl = redis.call('TTL', lobby)
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[2], ttl)
+        redis.call('EXPIRE', KEYS[3], ttl)
+    end
+end
+if previous then
+    redis.call('HSET', lobby, 'latest_number', number, 'previous_number', previous, 'called_mask', called_mask)
+else
+    redis.call('HSET', lobby, 'latest_number', number, 'called_mask', called_mask)
+end
+
+if called[3] == 'auto' then
+    -- Advance every line first: one call can complete lines of several players
+    local entries = redis.call('HGET', KEYS[5], 'n:' .. number)
+    local winner, winner_joined, winner_line
+    for entry in string.gmatch(entries or '', '[^\\n]+') do
+        if redis.call('HINCRBY', KEYS[5], entry, 1) == 3 then
+            local sep = string.find(entry, '|', 1, true)
+            local aid = string.sub(entry, sep + 1)
+            local line = tonumber(string.sub(entry, 1, sep - 1))
+            local player = redis.call('HMGET', lobby .. ':player:' .. aid, 'active', 'joined_at')
+            local joined = player[2] or ''
+            if player[1] == 'true' and (not winner or joined < winner_joined
+                    or (joined == winner_joined and (aid < winner or (aid == winner and line < winner_line)))) then
+                winner, winner_joined, winner_line = aid, joined, line
+            end
+        end
+    end
+    if winner then
+        redis.call('HSET', lobby, 'winning_pattern', LINE_NAMES[winner_line])
+        finish_game(lobby, winner, ARGV[1])
+        return -2
+    end
+end
+return tonumber(number)
+""")
+
+# KEYS: lobby
+# ARGV: winner, finished_at
+FINISH_GAME = register(_HELPERS + """
+if finish_game(KEYS[1], ARGV[1], ARGV[2]) then
+    return reply({finished = true}, 'finish')
+end
+return reply({finished = false})
+""")
+
+# KEYS: lobby, player, numbers_called
+# ARGV: alien_id, finished_at, highlighted_mask, stray
+# Number n is bit n-1 of a mask. The player's 8 line masks (lobby.WIN_LINES order)
+# were stored at submit time and the lobby keeps a running called_mask, so a claim
+# is a few mask comparisons. stray = '1' if a highlighted number is outside the pool.
+CLAIM_BINGO = register(_HELPERS + _CODEC + """
+local LINE_CELLS = {{1, 2, 3}, {4, 5, 6}, {7, 8, 9}, {1, 4, 7}, {2, 5, 8}, {3, 6, 9}, {1, 5, 9}, {3, 5, 7}}
+
+local lobby, player = KEYS[1], KEYS[2]
+local lobby_state = redis.call('HMGET', lobby, 'status', 'called_mask')
+local status = lobby_state[1]
+if not status then
+    return fail('Lobby not found')
+end
+if status ~= 'active' then
+    return fail('Game is not active')
+end
+local state = redis.call('HMGET', player, 'ready', 'active', 'line_masks', 'grid')
+if redis.call('EXISTS', player) == 0 then
+    return fail('Player not in this lobby')
+end
+if state[2] ~= 'true' then
+    return fail('Player is no longer active in this game')
+end
+
+-- Games started before masks were stored: derive them from the called sequence and the grid
+local called_mask = tonumber(lobby_state[2] or '')
+if not called_mask then
+    called_mask = 0
+    local sequence = called_sequence(KEYS[3], false)
+    for i = 2, #sequence do
+        called_mask = with_number(called_mask, string.byte(sequence, i))
+    end
+end
+local line_masks = {}
+if state[3] then
+    for mask in string.gmatch(state[3], '%d+') do
+        line_masks[#line_masks + 1] = tonumber(mask)
+    end
+else
+    local flat = {}
+    local grid = state[4] or ''
+    if string.sub(grid, 1, 1) == '[' then
+        for _, row in ipairs(cjson.decode(grid)) do
+            for _, n in ipairs(row) do
+                flat[#flat + 1] = n
+            end
+        end
+    elseif string.sub(grid, 1, 1) == CODEC_V1 then
+        for i = 2, #grid do
+            flat[#flat + 1] = string.byte(grid, i)
+        end
+    end
+    if #flat == 9 then
+        for i, cells in ipairs(LINE_CELLS) do
+            local mask = 0
+            for _, c in ipairs(cells) do
+                mask = with_number(mask, flat[c])
+            end
+            line_masks[i] = mask
+        end
+    end
+end
+
+-- Check 1: Do highlighted numbers form a winning pattern on the grid?
+local highlighted = tonumber(ARGV[3])
+local pattern = nil
+for i, line in ipairs(line_masks) do
+    if covers(highlighted, line) then
+        pattern = LINE_NAMES[i]
+        break
+    end
+end
+
+-- Check 2: Are ALL highlighted numbers actually called?
+local all_called = ARGV[4] ~= '1' and covers(called_mask, highlighted)
+
+if pattern and all_called then
+    local pot = tonumber(redis.call('HGET', lobby, 'pot'))
+    redis.call('HSET', lobby, 'winning_pattern', pattern)
+    finish_game(lobby, ARGV[1], ARGV[2])
+    local pot_text = string.gsub(string.reverse(string.gsub(string.reverse(tostring(pot)), '(%d%d%d)', '%1,')), '^,', '')
+    return reply({
+        valid = true,
+        winner = true,
+        pot = pot,
+        message = 'YOU WON! +' .. pot_text .. ' Alien coins',
+        pattern = pattern,
+    }, 'finish')
+end
+
+local active_count = redis.call('HINCRBY', lobby, 'active_count', -1)
+if state[1] == 'true' then
+    redis.call('HINCRBY', lobby, 'ready_count', -1)
+end
+local version = emit(lobby, {type = 'player_kicked', alien_id = ARGV[1], active_count = active_count})
+redis.call('HSET', player, 'active', 'false', 'version', version)
+local action = ''
+if active_count <= 0 and finish_game(lobby, '', ARGV[2]) then
+    action = 'finish'
+end
+return reply({
+    valid = false,
+    kicked = true,
+    message = "Invalid claim. You've been removed from the game.",
+}, action)
+""")
+
+# Credits a finalized invoice to the pot once, however often the provider
+# delivers it: the lobby's credited invoices set remembers it. A lobby that is
+# already gone gets only the ledger entry, so the payment can still be
+# reconciled. Returns 1 if credited, 0 for a repeat delivery.
+_CREDIT = """
+local function credit(lobby, invoices, invoice_id, alien_id, amount)
+    if redis.call('SADD', invoices, invoice_id) == 0 then
+        return 0
+    end
+    redis.call('EXPIRE', invoices, LEDGER_TTL)
+    record(lobby, 'payment', alien_id, amount, invoice_id)
+    if redis.call('EXISTS', lobby) == 1 then
+        local pot = redis.call('HINCRBY', lobby, 'pot', amount)
+        emit(lobby, {type = 'pot_credited', alien_id = alien_id, amount = tonumber(amount), pot = pot})
+        announce(lobby)
+    end
+    return 1
+end
+"""
+
+# KEYS: invoice
+# ARGV: lobby key prefix, lobby key suffix, invoice_id
+# Settles an invoice in one call: reads it, credits its lobby and marks it
+# finalized. The lobby keys come from the invoice, so they are not declared:
+# standalone Redis only. Replies 1 if credited, 0 for a repeat delivery and -1
+# for an unknown invoice.
+SETTLE_INVOICE = register(_HELPERS + _CREDIT + """
+local invoice = redis.call('HMGET', KEYS[1], 'lobby_id', 'alien_id', 'amount', 'status')
+if not invoice[1] or invoice[1] == '' then
+    return -1
+end
+if invoice[4] == 'finalized' then
+    return 0
+end
+local lobby = ARGV[1] .. invoice[1] .. ARGV[2]
+local credited = credit(lobby, lobby .. ':invoices', ARGV[3], invoice[2] or '', invoice[3])
+redis.call('HSET', KEYS[1], 'status', 'finalized')
+return credited
+""")
+
+# KEYS: lobby, credited invoices set
+# ARGV: invoice_id, alien_id, amount
+# SETTLE_INVOICE for Redis Cluster, where the invoice lives in another slot.
+CREDIT_INVOICE = register(_HELPERS + _CREDIT + """
+return credit(KEYS[1], KEYS[2], ARGV[1], ARGV[2], ARGV[3])
+""")
+
+# KEYS: lobby, players set
+# Deletes a lobby only while it is still forming with no players; replies 1 if it is gone.
+DISCARD_EMPTY_LOBBY = register("""
+local state = redis.call('HMGET', KEYS[1], 'status', 'player_count')
+if not state[1] then
+    return 1
+end
+if state[1] ~= 'forming' or tonumber(state[2] or '0') > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+return 1
+""")
+
+# --- Lobby name pool ---
+# Free celestial names live in a set; names in use are mapped from their lobby
+# id so they can be returned even after the lobby hash has expired. Overflow
+# names (pool exhausted) are not tracked and never return to the pool.
+
+# KEYS: free names set, in-use hash (lobby_id -> name), overflow counter
+# ARGV: lobby_id
+# Replies the allocated name, or the overflow sequence number if the pool is empty.
+ALLOCATE_NAME = register("""
+local name = redis.call('SPOP', KEYS[1])
+if name then
+    redis.call('HSET', KEYS[2], ARGV[1], name)
+    return name
+end
+return redis.call('INCR', KEYS[3])
+""")
+
+# KEYS: free names set, in-use hash
+# ARGV: lobby ids
+RELEASE_NAMES = register("""
+for _, lobby_id in ipairs(ARGV) do
+    local name = redis.call('HGET', KEYS[2], lobby_id)
+    if name then
+        redis.call('HDEL', KEYS[2], lobby_id)
+        redis.call('SADD', KEYS[1], name)
+    end
+end
+return 0
+""")
+
+# KEYS: free names set, in-use hash, seeded marker
+# ARGV: free name count, free names..., then lobby_id, name pairs in use
+# Seeds the pool once; later calls (other workers, restarts) are no-ops.
+SEED_NAMES = register("""
+if not redis.call('SET', KEYS[3], '1', 'NX') then
+    return 0
+end
+local free_count = tonumber(ARGV[1])
+for i = 2, free_count + 1 do
+    redis.call('SADD', KEYS[1], ARGV[i])
+end
+for i = free_count + 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+return 1
+""")
+
+
+async def load_scripts() -> None:
+    """Load every script into the Redis script cache so calls go out as EVALSHA."""
+    for script in _SCRIPTS:
+        await redis.script_load(script.script)
+
+
+def queue_script(pipe, script, keys: List[str], args: List = ()) -> None:
+    """Queue a preloaded script on a pipeline as a bare EVALSHA.
+
+    Going through the Script object would make redis-py issue SCRIPT EXISTS on
+    every execute; callers catch NoScriptError, call load_scripts() and retry,
+    and execute the pipeline under ``redis_client.no_retry()``.
+    """
+    pipe.evalsha(script.sha, len(keys), *keys, *args)
+
+
+async def run_transition(script, keys: List[str], args: List) -> Tuple[dict, str]:
+    """Run a transition script, raising ValueError for a rejected transition."""
+    payload_json, action = await script(keys=keys, args=args)
+    payload = json.loads(payload_json)
+    if "error" in payload:
+        raise ValueError(payload["error"])
+    return payload, action
@@ -0,0 +1,169 @@
+"""Offline Monte Carlo simulation of game length and ties per parameter set.
+
+Each simulated game draws a uniformly random call order and gives every player
+a grid as ``lobby._generate_random_grid`` would, then finds the first call that
+completes one of ``lobby.WIN_LINES`` on any grid. A tie is a game where that
+call completes a line on more than one grid at once, so in manual mode the
+winner is whoever claims first.
+
+The scalar game logic is vectorized with NumPy: a number's call position is
+looked up per grid cell, a line completes at the latest call among its cells
+and a grid at its earliest line. Chunks of games run in a process pool across
+all cores. ``--check`` first replays a sample of games through
+``check_win_patterns`` itself and compares.
+
+Needs NumPy, which the server does not (``pip install numpy``):
+
+    python -m simulation --games 2000000
+    python -m simulation --max-number 20 25 30 --players 2 5 10 --interval 2 3 --json
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+
+import lobby
+from lobby import MAX_NUMBER, MAX_PLAYERS, NUMBER_CALL_INTERVAL, WIN_LINES, check_win_patterns
+
+GRID_CELLS = 9
+CHUNK_GAMES = 20000
+PERCENTILES = (10, 50, 90, 99)
+
+_LINE_CELLS = np.array([cells for _, cells in WIN_LINES])
+
+
+def first_bingo(call_at: np.ndarray, cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Calls until the first bingo, and how many grids complete on that call.
+
+    ``call_at`` is (games, max_number): the 0-based position at which each
+    number (0-based) is called. ``cells`` is (games, players, 9): each
+    player's grid, row-major, as 0-based numbers.
+    """
+    cell_called = np.take_along_axis(call_at[:, None, :], cells, axis=2)
+    line_done = cell_called[:, :, _LINE_CELLS].max(axis=3)
+    grid_done = line_done.min(axis=2)
+    first = grid_done.min(axis=1)
+    winners = (grid_done == first[:, None]).sum(axis=1)
+    return first + 1, winners
+
+
+def simulate_chunk(job: Tuple[int, int, int, np.random.SeedSequence]) -> Tuple[np.ndarray, int]:
+    """Histogram of calls to the first bingo over one chunk of games, and the number of ties."""
+    max_number, players, games, seed = job
+    rng = np.random.default_rng(seed)
+    # argsort of uniform keys is a uniform permutation: a call order, or a grid's cells
+    call_at = rng.random((games, max_number)).argsort(axis=1).astype(np.int16)
+    cells = rng.random((games, players, max_number)).argsort(axis=2)[:, :, :GRID_CELLS]
+    calls, winners = first_bingo(call_at, cells)
+    return np.bincount(calls, minlength=max_number + 1), int((winners > 1).sum())
+
+
+def simulate(max_number: int, players: int, games: int, pool: ProcessPoolExecutor, seed: int) -> Tuple[np.ndarray, int]:
+    chunks = [CHUNK_GAMES] * (games // CHUNK_GAMES) + ([games % CHUNK_GAMES] if games % CHUNK_GAMES else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    histogram = np.zeros(max_number + 1, dtype=np.int64)
+    ties = 0
+    for chunk_histogram, chunk_ties in pool.map(simulate_chunk, [
+            (max_number, players, n, s) for n, s in zip(chunks, seeds)]):
+        histogram += chunk_histogram
+        ties += chunk_ties
+    return histogram, ties
+
+
+def summarize(histogram: np.ndarray, ties: int, interval: float) -> dict:
+    """Distribution of time to the first bingo; the first number is called as the game starts."""
+    games = int(histogram.sum())
+    calls = np.arange(len(histogram))
+    cumulative = np.cumsum(histogram) / games
+    percentiles = {f"p{p}": int(np.searchsorted(cumulative, p / 100)) for p in PERCENTILES}
+    mean_calls = float((calls * histogram).sum() / games)
+    return {
+        "games": games,
+        "tie_probability": ties / games,
+        "mean_calls": mean_calls,
+        "calls": percentiles,
+        "mean_seconds": (mean_calls - 1) * interval,
+        "seconds": {name: (value - 1) * interval for name, value in percentiles.items()},
+        "calls_histogram": {int(c): int(n) for c, n in zip(calls, histogram) if n},
+    }
+
+
+# --- Cross-check against the game code ---
+
+def _scalar_first_bingo(draw: List[int], grids: List[List[List[int]]]) -> Tuple[int, int]:
+    called = set()
+    for calls, number in enumerate(draw, start=1):
+        called.add(number)
+        winners = sum(check_win_patterns(grid, called) is not None for grid in grids)
+        if winners:
+            return calls, winners
+    return len(draw), 0
+
+
+def check(max_number: int, players: int, games: int) -> None:
+    """Replay games built by the game code through both paths; raise on any difference."""
+    saved = lobby.MAX_NUMBER
+    lobby.MAX_NUMBER = max_number  # _generate_random_grid and check_win_patterns read it
+    try:
+        draws, grids = [], []
+        for _ in range(games):
+            draw = random.sample(range(1, max_number + 1), max_number)
+            draws.append(draw)
+            grids.append([lobby._generate_random_grid() for _ in range(players)])
+        expected = [_scalar_first_bingo(draw, game_grids) for draw, game_grids in zip(draws, grids)]
+    finally:
+        lobby.MAX_NUMBER = saved
+
+    call_at = np.array([np.argsort(draw) for draw in draws])
+    cells = np.array(grids).reshape(games, players, GRID_CELLS) - 1
+    calls, winners = first_bingo(call_at, cells)
+    mismatches = sum((c, w) != e for c, w, e in zip(calls.tolist(), winners.tolist(), expected))
+    if mismatches:
+        raise SystemExit(f"check failed: {mismatches}/{games} games differ from check_win_patterns")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=1_000_000, help="games per parameter set")
+    parser.add_argument("--max-number", type=int, nargs="+", default=[MAX_NUMBER])
+    parser.add_argument("--players", type=int, nargs="+", default=[MAX_PLAYERS])
+    parser.add_argument("--interval", type=float, nargs="+", default=[NUMBER_CALL_INTERVAL],
+                        help="seconds between calls")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="verify against check_win_patterns first")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per parameter set")
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        for max_number, players in itertools.product(args.max_number, args.players):
+            if max_number < GRID_CELLS:
+                raise SystemExit(f"--max-number must be at least {GRID_CELLS}")
+            if args.check:
+                check(max_number, players, 2000)
+            start = time.perf_counter()
+            histogram, ties = simulate(max_number, players, args.games, pool, args.seed)
+            elapsed = time.perf_counter() - start
+            for interval in args.interval:
+                result = summarize(histogram, ties, interval)
+                params = {"max_number": max_number, "players": players, "interval": interval}
+                if args.json:
+                    print(json.dumps({**params, **result}))
+                    continue
+                seconds = result["seconds"]
+                print(f"max_number={max_number:<3} players={players:<3} interval={interval:<4g} "
+                      f"ties={result['tie_probability']:6.2%}  calls p50={result['calls']['p50']:<3} "
+                      f"seconds mean={result['mean_seconds']:6.1f} p10={seconds['p10']:<5g} "
+                      f"p50={seconds['p50']:<5g} p90={seconds['p90']:<5g} p99={seconds['p99']:<5g}")
+            if not args.json:
+                print(f"  {args.games} games in {elapsed:.1f}s ({args.games / elapsed / 1e6 * 60:.1f}M games/min)")
+
+
+if __name__ == "__main__":
+    main()
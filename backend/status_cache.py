@@ -0,0 +1,161 @@
+"""Per-worker cache of serialized status payloads, one entry per lobby version.
+
+Every poll still costs one STATUS_SNAPSHOT round trip, sent with the cached
+version as known_version: while the lobby is unchanged Redis replies with just
+the version and the cached bytes are served as they are. A new version is built
+and serialized once per worker and shared by every poller of that lobby.
+
+time_elapsed changes between versions, so it is kept out of the cached bytes
+and spliced onto the end when serving.
+
+Long polls (``wait_for_change``) park until the lobby moves past the client's
+version. Each watched lobby has one ``LobbyWatch`` per worker: a single event
+hub subscription whose every event triggers one snapshot, after which all the
+lobby's parked requests wake up and are served from the cache.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+import orjson
+
+from events import event_hub
+from lobby import _utc_timestamp, get_game_status
+
+MAX_ENTRIES = 1024
+
+# Player fields other players' views keep; grids are only sent to their owner.
+_PUBLIC_PLAYER_FIELDS = ("alien_id", "ready", "active", "joined_at")
+
+
+class StatusEntry:
+    __slots__ = ("version", "status", "body", "started_at", "_player_views")
+
+    def __init__(self, status: dict):
+        status.pop("time_elapsed", None)
+        self.version: int = status["version"]
+        self.status = status
+        self.body = orjson.dumps(status)
+        started_at = status.get("started_at")
+        self.started_at = _utc_timestamp(datetime.fromisoformat(started_at)) if started_at else None
+        self._player_views: Dict[str, bytes] = {}
+
+    def player_view(self, alien_id: str) -> bytes:
+        """The status as one player sees it: their own grid, everyone else's flags."""
+        players = self.status["players"]
+        if alien_id not in players:
+            alien_id = ""  # Spectators share one grid-less view
+        view = self._player_views.get(alien_id)
+        if view is None:
+            public = {
+                aid: player if aid == alien_id else {field: player[field] for field in _PUBLIC_PLAYER_FIELDS}
+                for aid, player in players.items()
+            }
+            view = self._player_views[alien_id] = orjson.dumps({**self.status, "players": public})
+        return view
+
+    def render(self, body: bytes) -> bytes:
+        """Complete a cached body with the current time_elapsed."""
+        elapsed = int(time.time() - self.started_at) if self.started_at else 0
+        return b'%s,"time_elapsed":%d}' % (body[:-1], elapsed)
+
+
+class LobbyWatch:
+    """Keeps one lobby's cache entry current while it has waiters, and wakes them on each change.
+
+    ``ready`` is set once the watch is subscribed and has cached the lobby, so
+    waiters read it from the cache instead of each fetching it.
+    """
+
+    def __init__(self, cache: "StatusCache", lobby_id: str):
+        self.changed = asyncio.Event()
+        self.ready = asyncio.Event()
+        self.waiters = 0
+        self._task = asyncio.create_task(self._run(cache, lobby_id))
+
+    async def _run(self, cache: "StatusCache", lobby_id: str) -> None:
+        async with event_hub.listen(lobby_id) as queue:
+            await self._refresh(cache, lobby_id)
+            self.ready.set()
+            while True:
+                await queue.get()
+                while not queue.empty():
+                    queue.get_nowait()  # A burst of events needs one snapshot
+                await self._refresh(cache, lobby_id)
+                changed, self.changed = self.changed, asyncio.Event()
+                changed.set()
+
+    @staticmethod
+    async def _refresh(cache: "StatusCache", lobby_id: str) -> None:
+        try:
+            await cache.get(lobby_id)
+        except ValueError:
+            pass  # Gone: the waiters find it missing from the cache
+        except Exception:
+            await asyncio.sleep(0.1)  # Redis hiccup: the waiters fetch for themselves
+
+    def close(self) -> None:
+        self._task.cancel()
+
+
+class StatusCache:
+    def __init__(self):
+        self._entries: "OrderedDict[str, StatusEntry]" = OrderedDict()
+        self._watches: Dict[str, LobbyWatch] = {}
+
+    async def get(self, lobby_id: str) -> StatusEntry:
+        """The current status entry of a lobby. Raises ValueError if it doesn't exist."""
+        entry: Optional[StatusEntry] = self._entries.get(lobby_id)
+        try:
+            status = await get_game_status(lobby_id, known_version=entry.version if entry else None)
+        except ValueError:
+            self._entries.pop(lobby_id, None)
+            raise
+        if status is not None:
+            entry = StatusEntry(status)
+            current = self._entries.get(lobby_id)
+            # A concurrent poll may already have cached a newer version
+            if current is None or current.version < entry.version:
+                self._entries[lobby_id] = entry
+        if lobby_id in self._entries:
+            self._entries.move_to_end(lobby_id)
+            while len(self._entries) > MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return entry
+
+    async def wait_for_change(self, lobby_id: str, known_version: int, timeout: float) -> StatusEntry:
+        """The lobby's status entry once its version differs from ``known_version``, or
+        the current one after ``timeout`` seconds. Raises ValueError if it doesn't exist."""
+        watch = self._watches.get(lobby_id)
+        if watch is None:
+            watch = self._watches[lobby_id] = LobbyWatch(self, lobby_id)
+        watch.waiters += 1
+        deadline = time.monotonic() + timeout
+        try:
+            try:
+                await asyncio.wait_for(watch.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            changed = watch.changed
+            entry = self._entries.get(lobby_id) or await self.get(lobby_id)
+            while entry.version == known_version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                changed = watch.changed
+                entry = self._entries.get(lobby_id) or await self.get(lobby_id)
+            return entry
+        finally:
+            watch.waiters -= 1
+            if not watch.waiters:
+                watch.close()
+                del self._watches[lobby_id]
+
+
+status_cache = StatusCache()
@@ -0,0 +1,43 @@
+"""Game flow tests run the real Lua scripts against fakeredis in process, or
+against a real Redis when TEST_REDIS_URL is set. The database is flushed
+before every test, so never point TEST_REDIS_URL at one holding data.
+
+    pip install -r requirements-dev.txt
+    python -m pytest
+    TEST_REDIS_URL=redis://localhost:6379/15 python -m pytest
+"""
+import os
+
+import pytest
+
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL")
+os.environ["DEV_MODE"] = "true"
+if TEST_REDIS_URL:
+    os.environ["REDIS_URL"] = TEST_REDIS_URL
+
+import redis_client  # noqa: E402
+
+if not TEST_REDIS_URL:
+    import fakeredis
+
+    # Before any module binds the client with ``from redis_client import redis``
+    redis_client.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+import scripts  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def script_cache(anyio_backend):
+    # Session scoped, so every test shares one event loop and the client's connections
+    await scripts.load_scripts()
+
+
+@pytest.fixture(autouse=True)
+async def redis(script_cache):
+    await redis_client.redis.flushdb()
+    return redis_client.redis
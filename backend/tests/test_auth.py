@@ -0,0 +1,63 @@
+"""JWKS cache refetch throttling, against a stub SSO key endpoint."""
+import httpx
+import pytest
+
+import auth
+
+pytestmark = pytest.mark.anyio
+
+KEY = {"kty": "RSA", "kid": "current", "use": "sig", "n": "AQAB", "e": "AQAB"}
+
+
+class StubSSO:
+    """JWKS endpoint counting fetches; set ``up = False`` to simulate an outage."""
+
+    def __init__(self):
+        self.fetches = 0
+        self.up = True
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.fetches += 1
+        if not self.up:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"keys": [KEY]})
+
+
+@pytest.fixture
+def sso():
+    return StubSSO()
+
+
+@pytest.fixture
+async def jwks(sso):
+    cache = auth.JWKSCache(ttl=0, refetch_interval=60,
+                           client=httpx.AsyncClient(transport=httpx.MockTransport(sso)))
+    yield cache
+    await cache.close()
+
+
+async def test_stale_keys_refetch_once_per_interval_during_outage(sso, jwks):
+    assert await jwks.get_key("current") == KEY
+    sso.up = False
+
+    # ttl=0: every key is stale, but only the first request may go to the provider
+    for _ in range(5):
+        assert await jwks.get_key("current") == KEY
+    assert sso.fetches == 1
+
+    jwks._last_attempt -= jwks.refetch_interval
+    assert await jwks.get_key("current") == KEY  # Failed refetch: cached keys still served
+    assert sso.fetches == 2
+
+
+async def test_unknown_kid_refetch_is_throttled(sso, jwks):
+    jwks.ttl = 3600
+    await jwks.get_key("current")
+
+    for _ in range(5):
+        assert await jwks.get_key("junk") is None
+    assert sso.fetches == 1
+
+    jwks._last_attempt -= jwks.refetch_interval
+    assert await jwks.get_key("junk") is None
+    assert sso.fetches == 2
@@ -0,0 +1,219 @@
+"""A lobby from joining to a settled game, through lobby.py and its Lua scripts."""
+import time
+
+import pytest
+
+import lobby
+import scheduler
+from redis_client import lobby_key
+
+pytestmark = pytest.mark.anyio
+
+GRIDS = {
+    "alice": [[1, 2, 3], [4, 5, 6], [7, 8, 9]],
+    "bob": [[10, 11, 12], [13, 14, 15], [16, 17, 18]],
+}
+
+
+async def _forming_lobby(players=()) -> str:
+    lobby_id = (await lobby.create_lobby())["lobby_id"]
+    for alien_id in players:
+        await lobby.add_player_to_lobby(lobby_id, alien_id)
+    return lobby_id
+
+
+async def _started_game(redis, draw_order) -> str:
+    """A game between alice and bob that will call ``draw_order`` in order."""
+    lobby_id = await _forming_lobby(GRIDS)
+    for alien_id, grid in GRIDS.items():
+        await lobby.submit_grid(lobby_id, alien_id, grid)
+    key = lobby_key(lobby_id, "draw_order")
+    await redis.delete(key)
+    await redis.rpush(key, *draw_order)
+    return lobby_id
+
+
+async def _call(lobby_id: str, count: int) -> None:
+    for _ in range(count):
+        await lobby.call_number_batch([lobby_id])
+
+
+# --- Forming ---
+
+async def test_join_stops_at_capacity(redis):
+    lobby_id = await _forming_lobby(f"alien_{i}" for i in range(lobby.MAX_PLAYERS))
+
+    with pytest.raises(ValueError, match="full"):
+        await lobby.add_player_to_lobby(lobby_id, "one_too_many")
+
+    status = await lobby.get_game_status(lobby_id)
+    assert status["player_count"] == lobby.MAX_PLAYERS
+    assert status["pot"] == lobby.MAX_PLAYERS * lobby.BUY_IN_AMOUNT
+    assert not await redis.sismember(lobby.EMPTY_LOBBIES_KEY, lobby_id)
+
+
+async def test_leave_refunds_buy_in(redis):
+    lobby_id = await _forming_lobby(["alice", "bob"])
+
+    await lobby.remove_player_from_lobby(lobby_id, "bob")
+
+    status = await lobby.get_game_status(lobby_id)
+    assert status["pot"] == lobby.BUY_IN_AMOUNT
+    assert list(status["players"]) == ["alice"]
+    ledger = await lobby.replay_ledger(lobby_id)
+    assert ledger["pot"] == status["pot"]
+    assert [entry["type"] for entry in ledger["entries"]] == ["buy_in", "buy_in", "refund"]
+
+    # Empty again: back in the pool, which then trims itself to its target size
+    await lobby.remove_player_from_lobby(lobby_id, "alice")
+    assert await redis.scard(lobby.EMPTY_LOBBIES_KEY) == lobby.WARM_EMPTY_LOBBIES
+
+
+async def test_last_grid_submitted_starts_game(redis):
+    lobby_id = await _forming_lobby(GRIDS)
+
+    await lobby.submit_grid(lobby_id, "alice", GRIDS["alice"])
+    assert (await lobby.get_game_status(lobby_id))["status"] == "forming"
+
+    await lobby.submit_grid(lobby_id, "bob", GRIDS["bob"])
+    status = await lobby.get_game_status(lobby_id)
+    assert status["status"] == "active"
+    assert status["ready_count"] == 2
+    assert await redis.zscore(scheduler.DUE_KEY, f"call:{lobby_id}") is not None
+
+
+async def test_submit_rejects_invalid_grid(redis):
+    lobby_id = await _forming_lobby(["alice"])
+
+    with pytest.raises(ValueError, match="unique"):
+        await lobby.submit_grid(lobby_id, "alice", [[1, 1, 2], [3, 4, 5], [6, 7, 8]])
+
+
+# --- Number calling ---
+
+async def test_failing_lobby_does_not_hold_back_its_batch(redis):
+    healthy = await _started_game(redis, [1, 2, 3])
+    broken = await _started_game(redis, [1, 2, 3])
+    await redis.set(lobby_key(broken, "called_versions"), "not a list")
+
+    results = await lobby.call_number_batch([broken, healthy])
+
+    assert isinstance(results[0], Exception)
+    assert isinstance(results[1], float)
+    assert (await lobby.get_game_status(healthy))["called_numbers"] == [1]
+
+    # Through the scheduler: only the broken lobby's job stays under its lease
+    await redis.zadd(scheduler.DUE_KEY, {f"call:{broken}": 0, f"call:{healthy}": 0})
+    await scheduler.run_pass()
+    assert await redis.zscore(scheduler.DUE_KEY, f"call:{healthy}") < time.time() + lobby.NUMBER_CALL_INTERVAL + 1
+    assert await redis.zscore(scheduler.DUE_KEY, f"call:{broken}") > time.time() + scheduler.LEASE_SECONDS - 1
+    assert (await lobby.get_game_status(healthy))["called_numbers"] == [1, 2]
+
+
+async def test_game_ending_in_a_failed_batch_is_still_finished(redis):
+    ended = await _started_game(redis, [1])
+    broken = await _started_game(redis, [1, 2, 3])
+    await redis.set(lobby_key(broken, "called_versions"), "not a list")
+    await _call(ended, 1)
+
+    # The draw order is exhausted: the follow-up finishes the game despite the broken neighbour
+    results = await lobby.call_number_batch([broken, ended])
+
+    assert results[1] is None
+    assert (await lobby.get_game_status(ended))["status"] == "finished"
+    assert not await redis.sismember(lobby.ACTIVE_LOBBIES_KEY, ended)
+
+
+# --- Claims ---
+
+async def test_valid_claim_wins_the_pot(redis):
+    lobby_id = await _started_game(redis, [1, 2, 3, 10])
+    await _call(lobby_id, 3)
+
+    result = await lobby.verify_claim(lobby_id, "alice", [1, 2, 3])
+
+    assert result["valid"] and result["winner"]
+    assert result["pattern"] == "row_0"
+    assert result["pot"] == 2 * lobby.BUY_IN_AMOUNT
+    status = await lobby.get_game_status(lobby_id)
+    assert (status["status"], status["winner"]) == ("finished", "alice")
+    assert not await redis.sismember(lobby.ACTIVE_LOBBIES_KEY, lobby_id)
+    ledger = await lobby.replay_ledger(lobby_id)
+    assert ledger["paid_out"] == 2 * lobby.BUY_IN_AMOUNT
+
+
+async def test_claim_with_uncalled_number_kicks_player(redis):
+    lobby_id = await _started_game(redis, [1, 2, 3, 10])
+    await _call(lobby_id, 2)
+
+    result = await lobby.verify_claim(lobby_id, "alice", [1, 2, 3])
+
+    assert not result["valid"] and result["kicked"]
+    status = await lobby.get_game_status(lobby_id)
+    assert status["status"] == "active"
+    assert not status["players"]["alice"]["active"]
+    with pytest.raises(ValueError, match="no longer active"):
+        await lobby.verify_claim(lobby_id, "alice", [1, 2, 3])
+
+
+async def test_kicking_every_player_finishes_without_winner(redis):
+    lobby_id = await _started_game(redis, [1, 2, 3, 10])
+    await _call(lobby_id, 1)
+
+    await lobby.verify_claim(lobby_id, "alice", [1, 2, 3])
+    await lobby.verify_claim(lobby_id, "bob", [10, 11, 12])
+
+    status = await lobby.get_game_status(lobby_id)
+    assert (status["status"], status["winner"]) == ("finished", None)
+    assert not await redis.sismember(lobby.ACTIVE_LOBBIES_KEY, lobby_id)
+    assert (await lobby.replay_ledger(lobby_id))["paid_out"] == 0
+
+
+async def test_auto_daub_settles_first_completed_line(redis, monkeypatch):
+    monkeypatch.setattr(lobby, "DAUB_MODE", "auto")
+    lobby_id = await _started_game(redis, [10, 3, 11, 5, 7, 12])
+
+    await _call(lobby_id, 4)
+    assert (await lobby.get_game_status(lobby_id))["status"] == "active"
+
+    # 7 completes alice's anti-diagonal (3, 5, 7) before bob's top row needs 12
+    assert await lobby.call_number_batch([lobby_id]) == [None]
+    status = await lobby.get_game_status(lobby_id)
+    assert (status["status"], status["winner"], status["winning_pattern"]) == ("finished", "alice", "diagonal_anti")
+    assert (await lobby.replay_ledger(lobby_id))["paid_out"] == 2 * lobby.BUY_IN_AMOUNT
+
+
+@pytest.mark.parametrize("first", ["alice", "bob"])
+async def test_auto_daub_tie_goes_to_earliest_joiner(redis, monkeypatch, first):
+    monkeypatch.setattr(lobby, "DAUB_MODE", "auto")
+    # Same top row on both cards: the call of 3 completes it for everyone at once
+    grids = {"alice": GRIDS["alice"], "bob": [[1, 2, 3], [13, 14, 15], [16, 17, 18]]}
+    order = [first] + [alien_id for alien_id in grids if alien_id != first]
+    lobby_id = await _forming_lobby(order)
+    for alien_id in order:
+        await lobby.submit_grid(lobby_id, alien_id, grids[alien_id])
+    await redis.delete(lobby_key(lobby_id, "draw_order"))
+    await redis.rpush(lobby_key(lobby_id, "draw_order"), 1, 2, 3)
+
+    await _call(lobby_id, 3)
+
+    status = await lobby.get_game_status(lobby_id)
+    assert (status["status"], status["winner"], status["winning_pattern"]) == ("finished", first, "row_0")
+
+
+# --- Status deltas ---
+
+async def test_status_since_sends_only_new_calls(redis):
+    lobby_id = await _started_game(redis, [4, 8, 15, 16, 17])
+    await _call(lobby_id, 2)
+    seen = await lobby.get_game_status(lobby_id)
+    assert seen["called_numbers"] == [4, 8]
+
+    await _call(lobby_id, 2)
+    delta = await lobby.get_game_status(lobby_id, since=seen["version"])
+
+    assert delta["new_called_numbers"] == [15, 16]
+    assert "called_numbers" not in delta
+    assert delta["players"] == {}
+    assert delta["player_ids"] == sorted(GRIDS)
+    assert await lobby.get_game_status(lobby_id, since=delta["version"], known_version=delta["version"]) is None
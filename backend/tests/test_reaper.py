@@ -0,0 +1,35 @@
+"""The reaper's periodic sweep repairing the lobby indexes."""
+import pytest
+
+import lobby
+import reaper
+from redis_client import lobby_key
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sweep_refills_empty_pool_after_interrupted_join(redis, monkeypatch):
+    await lobby.ensure_empty_lobby_exists()
+    lobby_id = next(iter(await redis.smembers(lobby.EMPTY_LOBBIES_KEY)))
+
+    # The joining worker dies after taking the lobby out of the pool, before replacing it
+    async def crash():
+        pass
+    monkeypatch.setattr(lobby, "ensure_empty_lobby_exists", crash)
+    await lobby.add_player_to_lobby(lobby_id, "alice")
+    monkeypatch.undo()
+    assert await redis.scard(lobby.EMPTY_LOBBIES_KEY) == 0
+
+    assert await reaper.reap_lobbies() == 0
+    assert await redis.scard(lobby.EMPTY_LOBBIES_KEY) == lobby.WARM_EMPTY_LOBBIES
+    assert not await redis.sismember(lobby.EMPTY_LOBBIES_KEY, lobby_id)
+
+
+async def test_sweep_drops_expired_lobby(redis):
+    await lobby.ensure_empty_lobby_exists()
+    lobby_id = next(iter(await redis.smembers(lobby.EMPTY_LOBBIES_KEY)))
+    await redis.delete(lobby_key(lobby_id))
+
+    assert await reaper.reap_lobbies() == 1
+    assert not await redis.sismember(lobby.ACTIVE_LOBBIES_KEY, lobby_id)
+    assert await redis.scard(lobby.EMPTY_LOBBIES_KEY) == lobby.WARM_EMPTY_LOBBIES
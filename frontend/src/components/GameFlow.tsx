@@ -219,12 +219,14 @@ export default function GameFlow() {
             />
           </div>
 
-          {/* Claim button */}
-          <ClaimButton
-            onClaim={handleClaim}
-            disabled={gameState.status !== 'active'}
-            isClaiming={isLoading}
-          />
+          {/* Claim button (auto-daub lobbies settle winners server-side) */}
+          {gameState.daub_mode !== 'auto' && (
+            <ClaimButton
+              onClaim={handleClaim}
+              disabled={gameState.status !== 'active'}
+              isClaiming={isLoading}
+            />
+          )}
 
           {/* Inline chat */}
           <GameChat />
@@ -1,7 +1,7 @@
 import { useState, useEffect, useCallback } from 'react';
-import { getGameStatus } from '../services/api';
+import { getGameStatus, gameEventsUrl } from '../services/api';
 import { POLL_INTERVAL } from '../config';
-import type { GameStatus } from '../types';
+import type { GameStatus, LobbyEvent } from '../types';
 
 export function useGameState(lobbyId: string | null, authToken: string | null) {
   const [gameState, setGameState] = useState<GameStatus | null>(null);
@@ -24,8 +24,44 @@ export function useGameState(lobbyId: string | null, authToken: string | null) {
     // Fetch immediately
     fetchStatus();
 
-    const interval = setInterval(fetchStatus, POLL_INTERVAL);
-    return () => clearInterval(interval);
+    // Poll only while the push channel is down
+    let interval: ReturnType<typeof setInterval> | null = null;
+    const startPolling = () => {
+      if (!interval) interval = setInterval(fetchStatus, POLL_INTERVAL);
+    };
+    const stopPolling = () => {
+      if (interval) clearInterval(interval);
+      interval = null;
+    };
+
+    const socket = new WebSocket(gameEventsUrl(authToken, lobbyId));
+    socket.onopen = stopPolling;
+    socket.onclose = startPolling;
+    socket.onmessage = (message) => {
+      const event: LobbyEvent = JSON.parse(message.data);
+      if (event.type === 'snapshot') {
+        setGameState(event.status);
+      } else if (event.type === 'number_called') {
+        // A snapshot or fetch at this version or later already has the number
+        setGameState((prev) => prev && event.version > prev.version ? {
+          ...prev,
+          version: event.version,
+          latest_number: event.number,
+          previous_number: event.previous_number,
+          called_numbers: [...prev.called_numbers, event.number],
+        } : prev);
+      } else {
+        // Lobby membership and lifecycle changes are rare — take a fresh snapshot
+        fetchStatus();
+      }
+    };
+    startPolling();
+
+    return () => {
+      socket.onclose = null;
+      socket.close();
+      stopPolling();
+    };
   }, [lobbyId, authToken, fetchStatus]);
 
   return { gameState, error, refetch: fetchStatus };
@@ -71,7 +71,7 @@ export async function getGameStatus(
   token: string,
   lobbyId: string
 ): Promise<GameStatus> {
-  return request(`/api/game/${lobbyId}/status`, {
+  return request(`/api/game/${lobbyId}/status?view=player`, {
     headers: authHeaders(token),
   });
 }
@@ -88,3 +88,8 @@ export async function claimBingo(
     body: JSON.stringify({ alien_id: alienId, highlighted_numbers: highlightedNumbers }),
   });
 }
+
+export function gameEventsUrl(token: string, lobbyId: string): string {
+  const base = (API_URL || window.location.origin).replace(/^http/, 'ws');
+  return `${base}/api/game/${lobbyId}/ws?token=${encodeURIComponent(token)}`;
+}
@@ -10,8 +10,9 @@ export interface LobbyInfo {
 
 export interface Player {
   alien_id: string;
-  numbers: number[];
-  grid: number[][];
+  // Only present on the requesting player's own entry
+  numbers?: number[];
+  grid?: number[][];
   ready: boolean;
   active: boolean;
   joined_at: string;
@@ -19,6 +20,7 @@ export interface Player {
 
 export interface GameStatus {
   lobby_id: string;
+  version: number;
   status: 'forming' | 'active' | 'finished' | 'in_progress';
   buy_in_amount: number;
   pot: number;
@@ -30,6 +32,8 @@ export interface GameStatus {
   previous_number: number | null;
   called_numbers: number[];
   winner: string | null;
+  winning_pattern?: string | null;
+  daub_mode?: 'manual' | 'auto';
   time_elapsed: number;
 }
 
@@ -48,3 +52,13 @@ export interface JoinLobbyResponse {
   player_count: number;
   pot: number;
 }
+
+export type LobbyEvent =
+  | { type: 'snapshot'; status: GameStatus }
+  | { type: 'number_called'; version: number; number: number; previous_number: number | null }
+  | { type: 'player_joined' | 'player_left'; alien_id: string; player_count: number; pot: number }
+  | { type: 'player_ready'; alien_id: string; ready_count: number }
+  | { type: 'player_kicked'; alien_id: string; active_count: number }
+  | { type: 'game_started'; started_at: string }
+  | { type: 'game_finished'; winner: string | null }
+  | { type: 'resync' };